@@ -1,12 +1,26 @@
 # -*- coding: utf-8 -*-
-from pkg_resources import get_distribution, DistributionNotFound
+try:
+    # importlib.metadata is much faster to import than pkg_resources
+    from importlib.metadata import version as get_version, PackageNotFoundError
+except ImportError:
+    from pkg_resources import get_distribution, DistributionNotFound as PackageNotFoundError
+
+    def get_version(dist_name):
+        return get_distribution(dist_name).version
 
 try:
     # Change here if project is renamed and does not equal the package name
     dist_name = __name__
-    __version__ = get_distribution(dist_name).version
-except DistributionNotFound:
+    __version__ = get_version(dist_name)
+except PackageNotFoundError:
     __version__ = 'unknown'
 
 LOGGER_BASE_NAME = __name__
 CACHE_DIRECTORY = "cache"
+
+
+def run_once(args_in):
+    """ Run the kvk_url_finder with the command line arguments *args_in*. See
+    :func:`kvk_url_finder.kvk_url_finder_main.run_once` """
+    from kvk_url_finder.kvk_url_finder_main import run_once as _run_once
+    _run_once(args_in)
@@ -0,0 +1,54 @@
+"""
+Entry points for the console scripts
+
+The scripts import pandas, peewee and (for the plotter) matplotlib at the top of their modules,
+which takes a noticeable time. The functions in this module answer --version before importing the
+script module, such that this option returns immediately.
+"""
+
+import importlib
+import sys
+
+
+def _show_version(script_file_name):
+    """
+    Print the version and return True if only the version is asked for
+
+    Parameters
+    ----------
+    script_file_name: str
+        Name of the script module as shown in the version message
+
+    Returns
+    -------
+    bool:
+        True if the version has been printed and the script does not need to run
+    """
+    if len(sys.argv) == 2 and sys.argv[1] in ("-V", "--version"):
+        from kvk_url_finder import __version__
+        print("{}\nPart of kvk_url_finder version {}".format(script_file_name, __version__))
+        return True
+    return False
+
+
+def _run_script(module_name):
+    """ Import the script module *module_name* and run its entry point """
+    if _show_version(module_name + ".py"):
+        return
+    module = importlib.import_module("kvk_url_finder." + module_name)
+    module._run()
+
+
+def kvk_url_finder():
+    """ Entry point of the kvk_url_finder script """
+    _run_script("kvk_url_finder_main")
+
+
+def url_to_kvk():
+    """ Entry point of the url_to_kvk script """
+    _run_script("url_to_kvk_main")
+
+
+def kvk_plotter():
+    """ Entry point of the kvk_plotter script """
+    _run_script("kvk_plotter")
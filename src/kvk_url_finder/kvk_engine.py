@@ -1,31 +1,48 @@
 import collections
+import contextlib
 import datetime
 import multiprocessing as mp
 import os
 import re
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 import progressbar as pb
 import pytz
-import tldextract
 from tqdm import tqdm
 
 from cbs_utils.misc import (create_logger, is_postcode, print_banner)
-from cbs_utils.web_scraping import (UrlSearchStrings, BTW_REGEXP, ZIP_REGEXP, KVK_REGEXP,
-                                    get_clean_url, RequestUrl)
+from cbs_utils.web_scraping import (UrlSearchStrings, get_clean_url, RequestUrl)
 from kvk_url_finder import LOGGER_BASE_NAME, CACHE_DIRECTORY
-from kvk_url_finder.model_variables import COUNTRY_EXTENSIONS, SORT_ORDER_HREFS
+from kvk_url_finder.model_variables import EXCLUDED_EXTENSIONS, SORT_ORDER_HREFS
 from kvk_url_finder.models import *
 from kvk_url_finder.utils import (Range, check_if_url_needs_update, UrlInfo, UrlCompanyRanking,
-                                  read_sql_table, paste_strings, get_string_name_from_df)
+                                  read_sql_table, paste_strings, get_string_name_from_df,
+                                  tld_extract, SEARCH_STRINGS, get_name_matches)
 
 try:
     from kvk_url_finder import __version__
 except ModuleNotFoundError:
     __version__ = "unknown"
 
+try:
+    # pyarrow is only needed if the pyarrow csv engine is selected
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+try:
+    # indexed_bzip2 decompresses the bz2 input files with multiple threads
+    import indexed_bzip2
+except ImportError:
+    indexed_bzip2 = None
+
 # remove comment if you want to add the line profiler
 #try:
 #    # if profile exist, it means we are running kernprof to time all the lines of the functions
@@ -50,8 +67,31 @@ COMPRESSION_TYPES = [None, "zlib", "blosc"]
 SCRAPERS = ["bs4", "scrapy"]
 
 MAX_SQL_CHUNK = 500
+CSV_CHUNK_SIZE = 100000
+CSV_ENGINES = ("pandas", "pyarrow")
+# the pyarrow reader, which streams the file per block, is used by default if it is available
+DEFAULT_CSV_ENGINE = "pyarrow" if pa_csv is not None else "pandas"
+# the input files are cached as parquet if pyarrow is available, otherwise as pickle
+CACHE_FILE_EXTENSION = ".parquet" if pa_csv is not None else ".pkl"
+PARQUET_COMPRESSION = "zstd"
+# size of the blocks processed by the threads of the pyarrow csv reader
+PYARROW_BLOCK_SIZE = 64 << 20
 
 STOP_FILE = "stop"
+# number of records read at once from a sql table when exporting the database
+EXPORT_CHUNK_SIZE = 10000
+# number of records processed between two checks for the stop file
+STOP_FILE_CHECK_INTERVAL = 64
+# the maximum number of threads used to scrape the urls of one company at the same time
+MAX_SCRAPE_THREADS = 8
+
+# the pattern used by clean_name to strip the abbreviations as B.V. N.V., etc, and everything from
+# an opening parenthesis to the end of the name
+RE_CLEAN_NAME = re.compile(r"\s(\w\.)+\s*|\(.*\).*$")
+# the characters which clean_name deletes afterwards: & and quotes and all the white space
+# characters of \s (the last one is U+3000)
+CLEAN_NAME_DELETE_TABLE = {code: None for code in range(0x3001) if chr(code).isspace()}
+CLEAN_NAME_DELETE_TABLE.update({ord("&"): None, ord('"'): None})
 
 # set up progress bar properties
 PB_WIDGETS = [pb.Percentage(), ' ', pb.Bar(marker='.', left='[', right=']'), ""]
@@ -91,22 +131,79 @@ def clean_name(naam):
     str:
         Clean name
     """
-    # de naam altijd in kleine letters
-    naam_small = naam.lower()
+    # de naam altijd in kleine letters. Dan in een keer verwijderen: alles wat er uit ziet als
+    # B.V. N.V., etc en alles wat tussen haakjes staat + wat er nog achter komt
+    naam_small = RE_CLEAN_NAME.sub("", naam.lower())
 
-    # alles wat er uit zit als B.V. N.V., etc  wordt verwijderd
-    naam_small = re.sub("\s(\w\.)+[\s]*", "", naam_small)
+    # alle & tekens en alle spaties verwijderen, zonder regular expression
+    naam_small = naam_small.translate(CLEAN_NAME_DELETE_TABLE)
 
-    # alles wat tussen haakjes staat + wat er nog achter komt verwijderen
-    naam_small = re.sub("\(.*\).*$", "", naam_small)
+    return naam_small
 
-    # alle & tekens verwijderen
-    naam_small = re.sub("[&\"]", "", naam_small)
 
-    # alle  spaties verwijderen
-    naam_small = re.sub("\s+", "", naam_small)
+def clean_names(names):
+    """
+    Clean a column of company names in one go, with the same rules as *clean_name*
 
-    return naam_small
+    Parameters
+    ----------
+    names: Series
+        Original names of the companies
+
+    Returns
+    -------
+    Series:
+        Clean names. Entries which are not a string become NaN
+    """
+    names_small = names.str.lower().str.replace(RE_CLEAN_NAME, "", regex=True)
+    return names_small.str.translate(CLEAN_NAME_DELETE_TABLE)
+
+
+def set_kvk_index(df):
+    """
+    Use the kvk number as index of a data frame read from a sql table, if the table has one
+
+    Parameters
+    ----------
+    df: DataFrame
+        The records of the sql table
+
+    Returns
+    -------
+    DataFrame:
+        The same data frame, with the kvk number as index if present
+    """
+    try:
+        df.set_index(KVK_KEY, inplace=True)
+    except KeyError:
+        pass
+    return df
+
+
+def typed_column_values(df, column, fill_value, dtype):
+    """
+    Get the values of a column as a numpy array of a numeric or boolean dtype
+
+    Parameters
+    ----------
+    df: DataFrame
+        The data frame holding the column
+    column: str
+        Name of the column. If the data frame does not have it, all values get the fill value
+    fill_value:
+        Value used for the missing (None or NaN) entries
+    dtype:
+        The dtype of the array
+
+    Returns
+    -------
+    ndarray:
+        A copy of the column values with the missing entries filled
+    """
+    if column not in df.columns:
+        return np.full(len(df.index), fill_value, dtype=dtype)
+    values = pd.to_numeric(df[column], errors="coerce").fillna(fill_value)
+    return values.to_numpy(dtype=dtype, copy=True)
 
 
 class KvKUrlParser(mp.Process):
@@ -123,6 +220,16 @@ class KvKUrlParser(mp.Process):
         Give the maximum number of entries to process. Default = None, which means all entries are
         used. For a finite number of entries the maximum number of rows read from the csv file is
         limited to 'maximum_entries'
+    sql_batch_size: int
+        Number of records written to the sql tables with one insert statement. Default = 10000
+    csv_chunk_size: int
+        Number of lines read from the csv input files at once. Default = 100000
+    csv_engine: {"pandas", "pyarrow"}
+        Reader used for the csv input files. The pyarrow reader is multi-threaded, but requires
+        the pyarrow package. Default = None, which means pyarrow if installed, otherwise pandas
+    decompress_threads: int
+        Number of threads used to decompress bz2 input files if indexed_bzip2 is installed.
+        Default = None, which means all cores are used
     """
 
     def __init__(self,
@@ -165,6 +272,10 @@ class KvKUrlParser(mp.Process):
                  filter_urls: list = None,
                  filter_kvks: list = None,
                  rescan_missing_urls: bool = False,
+                 sql_batch_size: int = SQL_BATCH_SIZE,
+                 csv_chunk_size: int = CSV_CHUNK_SIZE,
+                 csv_engine: str = None,
+                 decompress_threads: int = None,
                  ):
 
         # launch the process
@@ -202,11 +313,7 @@ class KvKUrlParser(mp.Process):
 
         self.rescan_missing_urls = rescan_missing_urls
         # a list of all country url extension which we want to exclude
-        self.exclude_extension = pd.DataFrame(COUNTRY_EXTENSIONS,
-                                              columns=["include", "country", "suffix"])
-        self.exclude_extension = self.exclude_extension[~self.exclude_extension["include"]]
-        self.exclude_extension = self.exclude_extension.set_index("suffix", drop=True).drop(
-            ["include"], axis=1)
+        self.exclude_extension = EXCLUDED_EXTENSIONS
 
         self.i_proc = i_proc
         self.store_html_to_cache = store_html_to_cache
@@ -226,6 +333,11 @@ class KvKUrlParser(mp.Process):
         self.current_time = datetime.datetime.now(pytz.timezone(self.timezone))
 
         self.kvk_selection = kvk_selection
+        if kvk_selection is not None:
+            # the kvk numbers of the selection as an index, such that the look up is hashed
+            self.kvk_selection_index = pd.Index(kvk_selection).unique()
+        else:
+            self.kvk_selection_index = None
 
         self.impose_url_for_kvk = impose_url_for_kvk
 
@@ -244,6 +356,16 @@ class KvKUrlParser(mp.Process):
         self.threshold_string_match = threshold_string_match
 
         self.maximum_entries = maximum_entries
+        self.sql_batch_size = sql_batch_size
+        self.csv_chunk_size = csv_chunk_size
+        if csv_engine is None:
+            csv_engine = DEFAULT_CSV_ENGINE
+        assert csv_engine in CSV_ENGINES
+        if csv_engine == "pyarrow" and pa_csv is None:
+            self.logger.warning("pyarrow is not installed. Reading the csv files with pandas")
+            csv_engine = "pandas"
+        self.csv_engine = csv_engine
+        self.decompress_threads = decompress_threads
 
         self.compression = compression
         self.progressbar = progressbar
@@ -263,6 +385,7 @@ class KvKUrlParser(mp.Process):
         self.website_df: pd.DataFrame = None
 
         self.company_vs_kvk = None
+        self.company_id_df: pd.DataFrame = None
         self.n_company = None
 
         self.company_urls_df: pd.DataFrame = None
@@ -273,14 +396,42 @@ class KvKUrlParser(mp.Process):
         self.kvk_ranges = None
 
         self.database = init_database(database_name, database_type=database_type,
-                                      user=user, password=password, host=hostname)
-        self.database.execute_sql("SET TIME ZONE '{}'".format(self.timezone))
+                                      user=user, password=password, host=hostname,
+                                      timezone=self.timezone)
         tables = init_models(self.database, self.reset_database)
         self.UrlNLTbl = tables[0]
         self.CompanyTbl = tables[1]
         self.AddressTbl = tables[2]
         self.WebsiteTbl = tables[3]
 
+    def release(self):
+        """
+        Drop the data frames of the last run and close the database connection
+
+        Notes
+        -----
+        * The parser of *main* may be reused by a next call in the same process. All data frames
+          are rebuilt by that call, so there is no need to keep them in memory in between
+        * The database reconnects automatically on the next query
+        """
+        self.company_df = None
+        self.url_df = None
+        self.address_df = None
+        self.kvk_df = None
+        self.website_df = None
+        self.company_vs_kvk = None
+        self.company_id_df = None
+        self.n_company = None
+        self.company_urls_df = None
+        self.company_address_df = None
+        self.kvk_ranges = None
+
+        if not self.database.is_closed():
+            self.database.close()
+        if isinstance(self.database, PooledPostgresqlExtDatabase):
+            # also close the idle connections kept by the pool
+            self.database.close_all()
+
     def run(self):
         # read from either original csv or cache. After this the data attribute is filled with a
         # data frame
@@ -288,8 +439,19 @@ class KvKUrlParser(mp.Process):
         self.find_best_matching_url()
 
     def generate_sql_tables(self):
-        self.read_database_addresses()
-        self.read_database_urls()
+        # read the address file in a second thread while the url file is read in this one. The
+        # csv readers and the decompression release the GIL, so both files are parsed at the
+        # same time. The second thread needs its own database connection
+        def read_addresses():
+            with self.database.connection_context():
+                self.read_database_addresses()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            addresses_read = executor.submit(read_addresses)
+            self.read_database_urls()
+            # wait for the addresses and raise the error of the thread, if any
+            addresses_read.result()
+
         self.merge_data_base_kvks()
 
         self.company_kvks_to_sql()
@@ -297,7 +459,70 @@ class KvKUrlParser(mp.Process):
         self.urls_per_kvk_to_sql()
         self.addresses_per_kvk_to_sql()
 
-    def populate_dataframes(self, only_the_company_df=False, only_found_urls=False):
+    def get_sql_chunk_size(self, n_columns):
+        """
+        Get the number of records which are inserted into the database with one statement
+
+        Parameters
+        ----------
+        n_columns: int
+            Number of columns per record
+
+        Returns
+        -------
+        int:
+            The sql batch size, limited by the maximum number of variables allowed in one
+            statement
+        """
+        return get_sql_chunk_size(self.database, n_columns, sql_batch_size=self.sql_batch_size)
+
+    def insert_rows(self, table, fields, rows, ignore_conflicts=False):
+        """
+        Insert a batch of rows into a table with one raw multi-row INSERT statement
+
+        Parameters
+        ----------
+        table: Model
+            The peewee model of the table to insert into
+        fields: list
+            The fields of the model belonging to the values in each row
+        rows: list
+            List of tuples with the python values per row. NaN values are stored as NULL
+        ignore_conflicts: bool
+            If True, rows of which the primary key is already present are skipped
+
+        Notes
+        -----
+        * Compared to insert_many, this skips the type conversion of peewee for each value, so the
+          values must already have the python type of the column (use tolist on numpy arrays).
+        * The number of rows should not exceed the chunk size given by get_sql_chunk_size
+        """
+        if not rows:
+            return
+        table_name = self.database.get_sql_context().sql(
+            pw.Entity(table._meta.table_name)).query()[0]
+        columns = self.database.get_sql_context().sql(
+            pw.EnclosedNodeList([pw.Entity(field.column_name) for field in fields])).query()[0]
+        row_values = "({})".format(", ".join([self.database.param] * len(fields)))
+
+        insert = "INSERT"
+        on_conflict = ""
+        if ignore_conflicts:
+            if isinstance(self.database, pw.SqliteDatabase):
+                insert = "INSERT OR IGNORE"
+            elif isinstance(self.database, pw.MySQLDatabase):
+                insert = "INSERT IGNORE"
+            else:
+                on_conflict = " ON CONFLICT DO NOTHING"
+
+        sql = "{} INTO {} {} VALUES {}{}".format(insert, table_name, columns,
+                                                ", ".join([row_values] * len(rows)), on_conflict)
+        params = [None if isinstance(value, float) and value != value else value
+                  for row in rows for value in row]
+        self.database.execute_sql(sql, params)
+
+    def populate_dataframes(self, only_the_company_df=False, only_found_urls=False,
+                            url_df=None):
         """
         Read the sql tables into pandas dataframes
 
@@ -305,6 +530,11 @@ class KvKUrlParser(mp.Process):
         ----------
         only_the_company_df: bool
             If true, only read the company_df table. This is the only table we need the first round
+        only_found_urls: bool
+            If true, only read the urls which are referred to by the web sites of the kvk range
+        url_df: DataFrame, optional
+            The url_nl table as read by another parser. If given, it is used instead of reading the
+            url_nl table again. Not used in combination with *only_found_urls*
 
         Notes
         -----
@@ -381,6 +611,12 @@ class KvKUrlParser(mp.Process):
 
             self.website_df.loc[:, DISTANCE_STRING_MATCH_KEY] = None
 
+            if url_df is not None and not only_found_urls:
+                # the full url table is the same for all the processes. Reuse the one already
+                # read, such that the forked processes share its memory pages
+                self.url_df = url_df
+                return
+
             if only_found_urls:
                 url_selection = list(self.website_df[URL_KEY].values)
             else:
@@ -480,75 +716,102 @@ class KvKUrlParser(mp.Process):
         else:
             self.logger.warning(f"Extension {export_file.suffix} not recognised")
 
+    def iterate_table_chunks(self, table, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Read a sql table in chunks of *chunk_size* records
+
+        Parameters
+        ----------
+        table: peewee.Model
+            The table to read
+        chunk_size: int
+            Number of records per chunk
+
+        Yields
+        ------
+        DataFrame:
+            The next chunk of the table, with the kvk number as index if present. An empty table
+            gives one empty data frame with only the column names, such that the export still
+            writes a sheet or file with the header
+        """
+        query = table.select()
+        n_records = 0
+        for records in pw.chunked(query.dicts().iterator(), chunk_size):
+            # tables without kvk number keep a running row number as index over all chunks
+            df = set_kvk_index(pd.DataFrame(records,
+                                            index=pd.RangeIndex(n_records,
+                                                                n_records + len(records))))
+            n_records += len(records)
+            yield df
+        if n_records == 0:
+            yield set_kvk_index(pd.DataFrame(columns=table._meta.sorted_field_names))
+
     def export_db(self, file_name):
+        """
+        Export the company, address and web site tables to excel, csv or pickle
+
+        Parameters
+        ----------
+        file_name: str
+            Name of the export file. For csv and pickle, one file per table is written with the
+            table name added to the file name
 
+        Notes
+        -----
+        * The tables are read in chunks. For csv, only one chunk is in memory at a time. The
+          excel writer (openpyxl) keeps the whole workbook in memory until it is closed, and a
+          pickle file is written from the combined chunks, so for those formats the memory use
+          still grows with the size of the tables
+        """
         export_file = Path(file_name)
+        tables = [self.CompanyTbl, self.AddressTbl, self.WebsiteTbl]
         if export_file.suffix in (".xls", ".xlsx"):
             with pd.ExcelWriter(file_name) as writer:
-                for cnt, table in enumerate([self.CompanyTbl, self.AddressTbl, self.WebsiteTbl]):
-                    query = table.select()
-                    df = pd.DataFrame(list(query.dicts()))
-                    try:
-                        df.set_index(KVK_KEY, inplace=True)
-                    except KeyError:
-                        pass
+                for cnt, table in enumerate(tables):
                     sheetname = table.__name__
                     self.logger.info(f"Appending sheet {sheetname}")
-                    df.to_excel(writer, sheet_name=sheetname)
+                    # write the chunks below each other; only the first one gets the header
+                    start_row = 0
+                    for df in self.iterate_table_chunks(table):
+                        df.to_excel(writer, sheet_name=sheetname, startrow=start_row,
+                                    header=start_row == 0)
+                        start_row += df.index.size + (1 if start_row == 0 else 0)
         elif export_file.suffix in (".csv", ".pkl"):
-            for cnt, table in enumerate([self.CompanyTbl, self.AddressTbl, self.WebsiteTbl]):
+            for cnt, table in enumerate(tables):
                 this_name = export_file.stem + "_" + table.__name__.lower() + export_file.suffix
-                query = table.select()
-                df = pd.DataFrame(list(query.dicts()))
-                try:
-                    df.set_index(KVK_KEY, inplace=True)
-                except KeyError:
-                    pass
                 self.logger.info(f"Writing to {this_name}")
-                if export_file == ".csv":
-                    df.to_csv(this_name)
-                elif export_file == ".pkl":
-                    df.to_pickle(this_name)
+                if export_file.suffix == ".csv":
+                    # append the chunks to the csv file; only the first one gets the header
+                    for i_chunk, df in enumerate(self.iterate_table_chunks(table)):
+                        df.to_csv(this_name, mode="w" if i_chunk == 0 else "a",
+                                  header=i_chunk == 0)
                 else:
-                    raise AssertionError
+                    # a pickle file can not be appended, so the chunks are combined first
+                    df = pd.concat(list(self.iterate_table_chunks(table)))
+                    df.to_pickle(this_name)
 
     def merge_data_base_kvks(self):
         """
         Merge the data base kvks.
 
-        The kvks in the url data base should be a subset of the url in the address data base
+        The kvks in the url data base should be a subset of the url in the address data base.
+        Therefore, the kvks of the url data base which are missing in the address data base are
+        added to the addresses, with the name of the first url record of this kvk. The names of
+        the kvks present in both data bases are left as they are, so no name union is needed
         """
 
-        # create a data frame with all the unique kvk number/name combi
-        df = self.url_df[[KVK_KEY, NAME_KEY]]
-        df.set_index(KVK_KEY, inplace=True, drop=True)
-        df = df[~df.index.duplicated()]
-
-        # also create a data frame from the unique address kvk's
-        name_key2 = NAME_KEY + "2"
-        df2 = self.address_df[[KVK_KEY, NAME_KEY]]
-        df2 = df2.rename(columns={NAME_KEY: name_key2})
-        df2.set_index(KVK_KEY, inplace=True, drop=True)
-        df2 = df2[~df2.index.duplicated()]
-
-        # merge them on the outer, so we can create a combined kvk list
-        df3 = pd.concat([df, df2], axis=1, join="outer")
+        # create a data frame with all the unique kvk number/name combi of the urls
+        url_kvks = self.url_df[[KVK_KEY, NAME_KEY]].drop_duplicates([KVK_KEY])
 
-        # replace al the empty field in NAME_KEY with tih
-        df3[NAME_KEY].where(~df3[NAME_KEY].isnull(), df3[name_key2], inplace=True)
-
-        df3.drop(name_key2, inplace=True, axis=1)
-
-        difference = df3.index.difference(df2.index)
-        new_kvk_name = df3.loc[difference, :]
+        # the kvk's which are not yet in the addresses are added with the name of the url list
+        new_kvk_name = url_kvks[~url_kvks[KVK_KEY].isin(self.address_df[KVK_KEY].values)]
 
         n_before = self.address_df.index.size
-        self.address_df.set_index(KVK_KEY, inplace=True)
 
-        # append the new address to the address data base
-        self.address_df = pd.concat([self.address_df, new_kvk_name], axis=0, sort=True)
-        self.address_df.sort_index(inplace=True)
-        self.address_df.reset_index(inplace=True)
+        # append the new address to the address data base, keeping it sorted on the kvk
+        self.address_df = pd.concat([self.address_df, new_kvk_name], axis=0, ignore_index=True,
+                                    sort=False)
+        self.address_df.sort_values(KVK_KEY, kind="stable", inplace=True, ignore_index=True)
         try:
             self.address_df.drop(["index"], axis=1, inplace=True)
         except KeyError as err:
@@ -590,6 +853,22 @@ class KvKUrlParser(mp.Process):
         else:
             pbar = None
 
+        # clean all the names at once instead of per company in the loop
+        company_names_small = clean_names(self.company_df[NAME_KEY])
+
+        # get the row positions of the urls and addresses per kvk and the valid post codes per kvk
+        # once, such that the loop does not need to scan the full data frames for each company
+        url_rows_per_kvk = self.website_df.groupby(KVK_KEY).indices
+        address_rows_per_kvk = self.address_df.groupby(KVK_KEY).indices
+        postcodes = self.address_df[POSTAL_CODE_KEY]
+        is_valid_post_code = np.fromiter(map(is_postcode, postcodes), dtype=bool,
+                                         count=postcodes.size)
+        postcodes_per_kvk = (self.address_df[is_valid_post_code]
+                             .groupby(KVK_KEY)[POSTAL_CODE_KEY]
+                             .apply(set)
+                             .to_dict())
+        no_rows = np.empty(0, dtype=np.intp)
+
         start = time.time()
         # loop over all the companies kvk numbers
         cnt = 0
@@ -599,14 +878,14 @@ class KvKUrlParser(mp.Process):
             if self.maximum_entries is not None and cnt == self.maximum_entries:
                 self.logger.info("Maximum entries reached")
                 break
-            if os.path.exists(STOP_FILE):
+            if cnt % STOP_FILE_CHECK_INTERVAL == 0 and os.path.exists(STOP_FILE):
                 self.logger.info("Stop file found. Quit processing")
                 os.remove(STOP_FILE)
                 break
 
             kvk_nummer = index
             company_name = get_string_name_from_df(NAME_KEY, row, index, self.company_df)
-            self.logger.info("Processing {} ({})".format(kvk_nummer, company_name))
+            self.logger.info("Processing %s (%s)", kvk_nummer, company_name)
 
             cnt += 1
 
@@ -614,8 +893,10 @@ class KvKUrlParser(mp.Process):
                 self.logger.info("Start a URL search for this company first")
 
             # for this kvk, get the list of urls + the address info
-            company_urls_df = self.website_df[self.website_df[KVK_KEY] == kvk_nummer].reset_index()
-            company_addresses_df = self.address_df[self.address_df[KVK_KEY] == kvk_nummer]
+            company_urls_df = self.website_df.iloc[
+                url_rows_per_kvk.get(kvk_nummer, no_rows)].reset_index()
+            company_addresses_df = self.address_df.iloc[
+                address_rows_per_kvk.get(kvk_nummer, no_rows)]
 
             try:
                 # match the url with the name of the company
@@ -623,9 +904,11 @@ class KvKUrlParser(mp.Process):
                     CompanyUrlMatch(company_record=row,
                                     kvk_nr=kvk_nummer,
                                     company_name=company_name,
+                                    company_name_small=company_names_small.loc[index],
                                     current_time=self.current_time,
                                     company_urls_df=company_urls_df,
                                     company_addresses_df=company_addresses_df,
+                                    company_postcodes=postcodes_per_kvk.get(kvk_nummer, set()),
                                     urls_df=self.url_df,
                                     imposed_urls=self.impose_url_for_kvk,
                                     distance_threshold=self.threshold_distance,
@@ -644,13 +927,15 @@ class KvKUrlParser(mp.Process):
                                     logger=self.logger
                                     )
 
-                self.logger.debug("Done with {}".format(company_url_match.company_name))
+                self.logger.debug("Done with %s", company_url_match.company_name)
             except pw.DatabaseError as err:
-                self.logger.warning(f"{err}")
+                self.logger.warning("%s", err)
                 self.logger.warning("skipping")
             else:
-                # succeeded the match. Now update the sql tables atomic
-                self.update_sql_tables(kvk_nummer, company_url_match)
+                # succeeded the match. Now update the sql tables atomic, such that all the
+                # updates of this company are committed at once instead of per statement
+                with self.database.atomic():
+                    self.update_sql_tables(kvk_nummer, company_url_match)
 
             if pbar:
                 pbar.update()
@@ -666,7 +951,8 @@ class KvKUrlParser(mp.Process):
         #    query.execute()
 
     def update_for_url_info_without_match(self, kvk_nummer, url_info: UrlInfo = None,
-                                          update_company_table: bool = True):
+                                          update_company_table: bool = True,
+                                          urls_in_url_nl: set = None):
 
         if url_info is not None:
             url = url_info.url
@@ -703,8 +989,7 @@ class KvKUrlParser(mp.Process):
             ).where((self.WebsiteTbl.company_id == kvk_nummer) & (self.WebsiteTbl.url_id == url))
             query.execute()
 
-            query = self.UrlNLTbl.select().where(self.UrlNLTbl.url == url)
-            if query.exists():
+            if self.url_in_url_nl(url, urls_in_url_nl):
                 logger.debug(f"Updating UrlNl {url}")
                 query = self.UrlNLTbl.update(
                     bestaat=bestaat,
@@ -721,7 +1006,7 @@ class KvKUrlParser(mp.Process):
             ).where(self.CompanyTbl.kvk_nummer == kvk_nummer)
             query.execute()
 
-    def update_for_url_info_with_match(self, kvk_nummer, url_info, url):
+    def update_for_url_info_with_match(self, kvk_nummer, url_info, url, urls_in_url_nl=None):
         """
         Update the sql tables in case we have at least one matching url found for the company
 
@@ -731,6 +1016,11 @@ class KvKUrlParser(mp.Process):
             Kvk number of the current company we are processing
         url_info: object UrlInfo
             Class holding the links to both the url_analyse and match result
+        url: str
+            The url to update
+        urls_in_url_nl: set, optional
+            The urls of the company which are present in the UrlNL table. If not given, the
+            table is queried for this url
         """
         # url = url_info.url
 
@@ -778,7 +1068,7 @@ class KvKUrlParser(mp.Process):
         except TypeError:
             all_psc = None
         try:
-            all_kvk = paste_strings(list(match.kvk_set), max_length=MAX_CHARFIELD_LENGTH)
+            all_kvk = paste_strings(match.kvk_list, max_length=MAX_CHARFIELD_LENGTH)
         except TypeError:
             all_kvk = None
         ecommerce = paste_strings(url_info.ecommerce, max_length=MAX_CHARFIELD_LENGTH)
@@ -790,8 +1080,7 @@ class KvKUrlParser(mp.Process):
             ssl = None
             ssl_valid = None
 
-        query = self.UrlNLTbl.select().where(self.UrlNLTbl.url == url)
-        if query.exists():
+        if self.url_in_url_nl(url, urls_in_url_nl):
             logger.debug(f"Updating UrlNl {url}")
             if match.matched_postcode:
                 query = self.UrlNLTbl.update(
@@ -828,14 +1117,16 @@ class KvKUrlParser(mp.Process):
 
         # loop over the external links in the url
         if url_info.url_analyse:
-            for ext_url in url_info.url_analyse.external_hrefs:
-                clean_url = get_clean_url(ext_url)
-                query = self.UrlNLTbl.select().where(self.UrlNLTbl.url == clean_url)
-                if not query.exists():
-                    logger.debug(f"Adding a new entry {clean_url}")
-                    self.UrlNLTbl.create(url=clean_url, bestaat=True, referred_by=url)
-                else:
-                    logger.debug(f"External already  {clean_url}")
+            # schoon alle externe urls op (zonder dubbelen) en voeg ze in een keer toe. De urls
+            # die al in de UrlNL tabel staan worden door de database overgeslagen
+            clean_urls = list(dict.fromkeys(get_clean_url(ext_url)
+                                            for ext_url in url_info.url_analyse.external_hrefs
+                                            if ext_url is not None))
+            logger.debug(f"Adding new entries if not present: {clean_urls}")
+            for batch in pw.chunked(clean_urls, self.get_sql_chunk_size(n_columns=3)):
+                self.UrlNLTbl.insert_many(
+                    [{URL_KEY: clean_url, BESTAAT_KEY: True, REFERRED_KEY: url}
+                     for clean_url in batch]).on_conflict_ignore().execute()
 
     def update_sql_tables(self, kvk_nummer, company_url_match):
         """
@@ -847,16 +1138,47 @@ class KvKUrlParser(mp.Process):
         if not company_url_match.urls.collection:
             self.update_for_url_info_without_match(kvk_nummer)
         else:
+            # check with one query which of the urls of this company are in the UrlNL table
+            urls = list(company_url_match.urls.collection.keys())
+            query = (self.UrlNLTbl
+                     .select(self.UrlNLTbl.url)
+                     .where(self.UrlNLTbl.url.in_(urls))
+                     .tuples())
+            urls_in_url_nl = set(url for (url,) in query)
+
             for url, url_info in company_url_match.urls.collection.items():
                 logger.debug(f"storing {url}")
 
                 if url_info.match is None:
                     self.update_for_url_info_without_match(kvk_nummer,
                                                            url_info=url_info,
-                                                           update_company_table=update_company)
+                                                           update_company_table=update_company,
+                                                           urls_in_url_nl=urls_in_url_nl)
                     update_company = False
                 else:
-                    self.update_for_url_info_with_match(kvk_nummer, url_info, url)
+                    self.update_for_url_info_with_match(kvk_nummer, url_info, url,
+                                                        urls_in_url_nl=urls_in_url_nl)
+
+    def url_in_url_nl(self, url, urls_in_url_nl=None):
+        """
+        Check if the url is present in the UrlNL table
+
+        Parameters
+        ----------
+        url: str
+            The url to check
+        urls_in_url_nl: set, optional
+            The urls known to be present, as obtained with one query for all urls of the
+            company. If not given, the table is queried for this url only
+
+        Returns
+        -------
+        bool:
+            True if the url is present in the UrlNL table
+        """
+        if urls_in_url_nl is not None:
+            return url in urls_in_url_nl
+        return self.UrlNLTbl.select().where(self.UrlNLTbl.url == url).exists()
 
     # @profile
     def read_csv_input_file(self,
@@ -893,30 +1215,62 @@ class KvKUrlParser(mp.Process):
         file_base, file_ext = os.path.splitext(file_name)
         file_base2, file_ext2 = os.path.splitext(file_base)
 
-        # build the cache file including the cache_directory
-        cache_file = Path(CACHE_DIRECTORY) / (file_base2 + ".pkl")
+        # build the cache file including the cache_directory. A pickle cache of an older run is
+        # still used if there is no parquet cache yet
+        cache_file = Path(CACHE_DIRECTORY) / (file_base2 + CACHE_FILE_EXTENSION)
+        pickle_cache_file = cache_file.with_suffix(".pkl")
 
-        if os.path.exists(cache_file):
-            # add the type so we can recognise it is a data frame
+        if cache_file.suffix == ".parquet" and cache_file.exists():
             self.logger.info("Reading from cache {}".format(cache_file))
-            df: pd.DataFrame = pd.read_pickle(cache_file)
+            df: pd.DataFrame = pd.read_parquet(cache_file, engine="pyarrow")
+        elif pickle_cache_file.exists():
+            # add the type so we can recognise it is a data frame
+            self.logger.info("Reading from cache {}".format(pickle_cache_file))
+            df: pd.DataFrame = pd.read_pickle(pickle_cache_file)
             df.reset_index(inplace=True)
         elif ".csv" in (file_ext, file_ext2):
             self.logger.info("Reading from file {}".format(file_name))
-            df = pd.read_csv(file_name,
-                             header=None,
-                             usecols=usecols,
-                             names=names
-                             )
+            reader = self.iterate_csv_chunks(file_name, usecols=usecols, names=names)
+
+            # read the file in chunks and only keep the kvk range of each chunk, such that we
+            # never need to hold the whole file in memory. The occurrences of the urls are counted
+            # over the whole file, so the spurious urls can be removed after the clipping
+            chunks = list()
+            url_count_parts = list()
+            n_before = 0
+            kvk_min = list()
+            kvk_max = list()
+            for chunk in reader:
+                n_before += chunk.index.size
+                kvk_min.append(chunk[KVK_KEY].min())
+                kvk_max.append(chunk[KVK_KEY].max())
+                if remove_spurious_urls:
+                    url_count_parts.append(chunk[URL_KEY].value_counts(sort=False))
+                chunks.append(self.clip_kvk_range(chunk, unique_key=unique_key,
+                                                  kvk_range=self.kvk_range_read))
+                self.logger.debug("Read {} lines".format(n_before))
+
+            n_after = sum([chunk.index.size for chunk in chunks])
+            self.logger.debug("Kept {} out of {} records".format(n_after, n_before))
+
+            # check if we have  any valid entries in the range
+            if n_after == 0:
+                raise ValueError("No records found in kvk range {} {} (kvk range: {} -- {})"
+                                 "".format(self.kvk_range_read.start, self.kvk_range_read.stop,
+                                           min(kvk_min, default=None),
+                                           max(kvk_max, default=None)))
+
+            df = pd.concat(chunks, ignore_index=True)
 
             if remove_spurious_urls:
                 self.logger.info("Removing spurious urls")
-                df = self.remove_spurious_urls(df)
-
-            df = self.clip_kvk_range(df, unique_key=unique_key, kvk_range=self.kvk_range_read)
+                # add the counts of all chunks in one go, instead of aligning the growing total
+                # with the counts of each chunk
+                url_counts = pd.concat(url_count_parts).groupby(level=0, sort=False).sum()
+                del url_count_parts
+                df = self.remove_spurious_urls(df, url_counts=url_counts)
 
-            self.logger.info("Writing data to cache {}".format(cache_file))
-            df.to_pickle(cache_file)
+            self.write_cache_file(df, cache_file)
         else:
             raise AssertionError("Can only read h5 or csv files")
 
@@ -929,6 +1283,94 @@ class KvKUrlParser(mp.Process):
 
         return df
 
+    def write_cache_file(self, dataframe, cache_file):
+        """
+        Write a data frame to the cache
+
+        Parameters
+        ----------
+        dataframe: DataFrame
+            The data to store
+        cache_file: Path
+            Name of the cache file. For a parquet file a pickle file is written instead in case
+            the columns can not be converted to parquet
+        """
+        if cache_file.suffix == ".parquet":
+            self.logger.info("Writing data to cache {}".format(cache_file))
+            try:
+                dataframe.to_parquet(cache_file, engine="pyarrow", compression=PARQUET_COMPRESSION)
+            except (ValueError, TypeError) as err:
+                # the arrow errors derive from these. Happens for columns with mixed types
+                self.logger.warning(f"Could not write parquet cache: {err}")
+                if cache_file.exists():
+                    cache_file.unlink()
+                cache_file = cache_file.with_suffix(".pkl")
+            else:
+                return
+
+        self.logger.info("Writing data to cache {}".format(cache_file))
+        dataframe.to_pickle(cache_file)
+
+    def iterate_csv_chunks(self, file_name, usecols, names):
+        """
+        Read the csv file in chunks of *csv_chunk_size* lines
+
+        Parameters
+        ----------
+        file_name: str
+            File name to read from
+        usecols: list
+            Selection of columns to read
+        names: list
+            Names to give to the columns
+
+        Yields
+        ------
+        DataFrame:
+            The next chunk of the csv file
+        """
+        if indexed_bzip2 is not None and str(file_name).endswith(".bz2"):
+            # decompress the bz2 blocks in parallel and pass the stream to the csv reader
+            n_threads = self.decompress_threads or os.cpu_count()
+            self.logger.debug(f"Decompressing {file_name} with {n_threads} threads")
+            csv_input = indexed_bzip2.open(str(file_name), parallelization=n_threads)
+        else:
+            csv_input = contextlib.nullcontext(file_name)
+
+        with csv_input as csv_file:
+            if self.csv_engine == "pyarrow":
+                # pyarrow streams the file per block, such that only one block is in memory.
+                # The names of the columns are assigned in the order of the column in the file,
+                # just like pandas
+                read_options = pa_csv.ReadOptions(autogenerate_column_names=True,
+                                                  block_size=PYARROW_BLOCK_SIZE)
+                convert_options = pa_csv.ConvertOptions(
+                    include_columns=["f{}".format(col) for col in sorted(usecols)],
+                    strings_can_be_null=True)
+                reader = pa_csv.open_csv(csv_file, read_options=read_options,
+                                         convert_options=convert_options)
+                # regroup the record batches into chunks of csv_chunk_size lines
+                batches = list()
+                n_rows = 0
+                for batch in reader:
+                    batches.append(batch)
+                    n_rows += batch.num_rows
+                    while n_rows >= self.csv_chunk_size:
+                        table = pa.Table.from_batches(batches)
+                        yield table.slice(0, self.csv_chunk_size).rename_columns(
+                            names).to_pandas()
+                        batches = table.slice(self.csv_chunk_size).to_batches()
+                        n_rows -= self.csv_chunk_size
+                if n_rows > 0:
+                    yield pa.Table.from_batches(batches).rename_columns(names).to_pandas()
+            else:
+                yield from pd.read_csv(csv_file,
+                                       header=None,
+                                       usecols=usecols,
+                                       names=names,
+                                       chunksize=self.csv_chunk_size
+                                       )
+
     # @profile
     def read_database_urls(self):
         """
@@ -953,43 +1395,39 @@ class KvKUrlParser(mp.Process):
         """
         Make a selection of kvk numbers
 
+        Parameters
+        ----------
+        dataframe: DataFrame
+            The data to select from
+        unique_key: str
+            Key of the column which makes the records of one kvk unique. Not needed for the
+            selection anymore, but kept for the callers
+        kvk_range: Range
+            Range of kvk numbers to keep. The start and stop are included
+
         Returns
         -------
-
+        DataFrame:
+            The records in the kvk range, which are also in the kvk selection if given
         """
 
         start = kvk_range.start
         stop = kvk_range.stop
-        n_before = dataframe.index.size
 
-        if start is not None or stop is not None or self.kvk_selection_kvk_key is not None:
-            self.logger.info("Selecting kvk number from {} to {}".format(start, stop))
-            idx = pd.IndexSlice
-            df = dataframe.set_index([KVK_KEY, unique_key])
+        if start is None and stop is None and self.kvk_selection_index is None:
+            return dataframe
 
-            if self.kvk_selection_kvk_key is not None:
-                df = df.loc[idx[self.kvk_selection, :], :]
+        self.logger.debug("Selecting kvk number from {} to {}".format(start, stop))
+        kvk_numbers = dataframe[KVK_KEY]
+        mask = np.ones(dataframe.index.size, dtype=bool)
+        if self.kvk_selection_index is not None:
+            mask &= kvk_numbers.isin(self.kvk_selection_index).values
+        if start is not None:
+            mask &= (kvk_numbers >= start).values
+        if stop is not None:
+            mask &= (kvk_numbers <= stop).values
 
-            if start is None:
-                df = df.loc[idx[:stop, :], :]
-            elif stop is None:
-                df = df.loc[idx[start:, :], :]
-            else:
-                df = df.loc[idx[start:stop, :], :]
-            df.reset_index(inplace=True)
-        else:
-            df = dataframe
-
-        n_after = df.index.size
-        self.logger.debug("Kept {} out of {} records".format(n_after, n_before))
-
-        # check if we have  any valid entries in the range
-        if n_after == 0:
-            self.logger.info(dataframe.info())
-            raise ValueError("No records found in kvk range {} {} (kvk range: {} -- {})".format(
-                start, stop, dataframe[KVK_KEY].min(), dataframe[KVK_KEY].max()))
-
-        return df
+        return dataframe[mask]
 
     # @profile
     def read_database_addresses(self):
@@ -1053,26 +1491,28 @@ class KvKUrlParser(mp.Process):
         return n_skip_entries
 
     # @profile
-    def remove_spurious_urls(self, dataframe):
+    def remove_spurious_urls(self, dataframe, url_counts=None):
         # first remove all the urls that occur more the 'n_count_threshold' times.
         urls = dataframe
-        # this line add the number of occurrences to each url
-        #
-        n_count = urls.groupby(URL_KEY)[URL_KEY].transform("count")
-        url_before = set(urls[URL_KEY].values)
-        urls = urls[n_count < self.n_count_threshold]
-        url_after = set(urls[URL_KEY].values)
-        url_removed = url_before.difference(url_after)
-        self.logger.debug("Removed URLS:\n{}".format(url_removed))
-
-        # turn the kvknumber/url combination into the index and remove the duplicates. This
-        # means that per company each url only occurs one time
-        urls = urls.set_index([KVK_KEY, URL_KEY]).sort_index()
-        # this removes all the duplicated indices, i.e. combination kvk_number/url. So if one
-        # kvk company has multiple times www.facebook.com at the web site, only is kept.
-        urls = urls[~urls.index.duplicated()]
-
-        urls.reset_index(inplace=True)
+        # the same urls occur for many companies. As a categorical, the counting and duplicate
+        # checks below hash the integer codes instead of the strings
+        urls[URL_KEY] = urls[URL_KEY].astype("category")
+        # count the number of occurrences of each url. In case the url_counts are given,
+        # they have been counted before over the whole input file
+        if url_counts is None:
+            url_counts = urls[URL_KEY].value_counts(sort=False)
+        urls_to_keep = url_counts.index[(url_counts < self.n_count_threshold).values]
+        is_spurious = ~urls[URL_KEY].isin(urls_to_keep).values
+        if self.logger.isEnabledFor(logging.DEBUG):
+            url_removed = urls.loc[is_spurious, URL_KEY].value_counts()
+            self.logger.debug("Removed URLS:\n{}".format(url_removed))
+        urls = urls[~is_spurious]
+
+        # remove the duplicated kvknumber/url combinations. This means that per company each url
+        # only occurs one time, so if one kvk company has multiple times www.facebook.com at the
+        # web site, only is kept.
+        urls = urls.drop_duplicates(subset=[KVK_KEY, URL_KEY], keep="first")
+        urls = urls.reset_index(drop=True)
 
         return urls
 
@@ -1083,30 +1523,21 @@ class KvKUrlParser(mp.Process):
 
         nr = self.address_df.index.size
         self.logger.info("Removing duplicated kvk entries")
-        query = self.CompanyTbl.select()
-        kvk_list = list()
+        # only fetch the kvk numbers, as tuples such that no model instances are created
+        query = self.CompanyTbl.select(self.CompanyTbl.kvk_nummer).tuples()
         try:
-            for company in query:
-                kvk_nummer = int(company.kvk_nummer)
-                if kvk_nummer in self.address_df[KVK_KEY].values:
-                    kvk_list.append(company.kvk_nummer)
+            kvk_in_db = np.fromiter((kvk_nummer for (kvk_nummer,) in query.iterator()),
+                                    dtype=np.int64)
         except pw.OperationalError:
             # nothing to remove
             return
 
-        kvk_in_db = pd.DataFrame(data=kvk_list, columns=[KVK_KEY])
-
-        kvk_in_db.set_index(KVK_KEY, inplace=True)
-        kvk_to_remove = self.address_df.set_index(KVK_KEY)
-        kvk_to_remove = kvk_to_remove[~kvk_to_remove.index.duplicated()]
-        kvk_to_remove = kvk_to_remove.reindex(kvk_in_db.index)
-        kvk_to_remove = kvk_to_remove[~kvk_to_remove[NAME_KEY].isnull()]
-        try:
-            self.address_df = self.address_df.set_index(KVK_KEY).drop(index=kvk_to_remove.index)
-        except KeyError:
-            self.logger.debug("Nothing to drop")
+        in_db = self.address_df[KVK_KEY].isin(kvk_in_db)
+        if in_db.any():
+            self.address_df = self.address_df[~in_db.values].reset_index(drop=True)
         else:
-            self.address_df.reset_index(inplace=True)
+            self.logger.debug("Nothing to drop")
+        self.logger.debug("Removed {} out of {} records".format(in_db.sum(), nr))
 
     # @profile
     def remove_duplicated_url_entries(self):
@@ -1120,53 +1551,43 @@ class KvKUrlParser(mp.Process):
         # we have already included. These can be removed from the data we have just read
         nr = self.url_df.index.size
         self.logger.info("Removing duplicated kvk/url combinies. Data read at start: {}".format(nr))
+        # in case the urls were not made categorical in remove_spurious_urls yet, do it here
+        self.url_df[URL_KEY] = self.url_df[URL_KEY].astype("category")
         self.logger.debug("Getting all sql websides from database")
-        kvk_list = list()
-        url_list = list()
-        name_list = list()
+        # join the web sites to the companies and build the data frame directly from the cursor
+        # of the single JOIN query, such that no model instances or intermediate lists are
+        # created. The url column holds the foreign key value
         query = (self.CompanyTbl
-                 .select()
-                 .prefetch(self.WebsiteTbl)
-                 )
-        for cnt, company in enumerate(query):
-            kvk_nr = company.kvk_nummer
-            naam = company.naam
-            for web in company.websites:
-                kvk_list.append(kvk_nr)
-                url_list.append(web.url)
-                name_list.append(naam)
-
-        kvk_in_db = pd.DataFrame(
-            data=list(zip(kvk_list, url_list, name_list)),
-            columns=[KVK_KEY, URL_KEY, NAME_KEY])
-        kvk_in_db.set_index([KVK_KEY, URL_KEY], drop=True, inplace=True)
-
-        # drop all the kvk number which we already have loaded in the database
+                 .select(self.CompanyTbl.kvk_nummer, self.WebsiteTbl.url)
+                 .join(self.WebsiteTbl))
+        sql, params = query.sql()
+        kvk_in_db = pd.DataFrame.from_records(self.database.execute_sql(sql, params),
+                                              columns=[KVK_KEY, URL_KEY])
+        # an empty result has object columns; the kvk numbers must match the integer column
+        kvk_in_db[KVK_KEY] = kvk_in_db[KVK_KEY].astype(np.int64)
+        # the merge keeps one row per url_df row only if the combinations are unique
+        kvk_in_db.drop_duplicates(inplace=True)
+
+        # drop all the kvk/url combinations which we already have loaded in the database with one
+        # anti join: a left merge which only keeps the rows not found in the database
         self.logger.debug("Dropping all duplicated web sides")
-        kvk_to_remove = self.url_df.set_index([KVK_KEY, URL_KEY])
-        kvk_to_remove = kvk_to_remove.reindex(kvk_in_db.index)
-        kvk_to_remove = kvk_to_remove[~kvk_to_remove[NAME_KEY].isnull()]
-        try:
-            self.url_df = self.url_df.set_index([KVK_KEY, URL_KEY]).drop(index=kvk_to_remove.index)
-        except KeyError:
+        merged = self.url_df.merge(kvk_in_db, on=[KVK_KEY, URL_KEY], how="left", indicator=True)
+        is_new = (merged["_merge"] == "left_only").values
+        if is_new.all():
             self.logger.debug("Nothing to drop")
         else:
-            self.url_df.reset_index(inplace=True)
+            self.url_df = self.url_df[is_new].reset_index(drop=True)
 
         self.logger.debug("Getting all  companies in Company table")
-        kvk_list = list()
-        name_list = list()
-        for company in self.CompanyTbl.select():
-            kvk_list.append(int(company.kvk_nummer))
-            name_list.append(company.naam)
-        companies_in_db = pd.DataFrame(data=list(zip(kvk_list, name_list)),
-                                       columns=[KVK_KEY, NAME_KEY])
-        companies_in_db.set_index([KVK_KEY], drop=True, inplace=True)
+        query = self.CompanyTbl.select(self.CompanyTbl.kvk_nummer).tuples()
+        kvk_companies_in_db = np.fromiter((kvk_nummer for (kvk_nummer,) in query.iterator()),
+                                          dtype=np.int64)
 
+        # the companies which are not in the url list are skipped by isin, where a drop on the
+        # index level would raise a KeyError
         self.logger.debug("Dropping all  duplicated companies")
-        comp_df = self.url_df.set_index([KVK_KEY, URL_KEY])
-        comp_df.drop(index=companies_in_db.index, level=0, inplace=True)
-        self.url_df = comp_df.reset_index()
+        in_db = self.url_df[KVK_KEY].isin(kvk_companies_in_db)
+        self.url_df = self.url_df[~in_db.values].reset_index(drop=True)
 
         nr = self.url_df.index.size
         self.logger.debug("Removed duplicated kvk/url combies. Data at end: {}".format(nr))
@@ -1184,10 +1605,12 @@ class KvKUrlParser(mp.Process):
         self.kvk_df = self.address_df[[KVK_KEY, NAME_KEY]].drop_duplicates([KVK_KEY])
         # self.kvk_df.loc[:, URLNL_KEY] = None
 
-        record_list = list(self.kvk_df.to_dict(orient="index").values())
+        record_list = list(zip(self.kvk_df[KVK_KEY].tolist(), self.kvk_df[NAME_KEY].tolist()))
+        fields = [self.CompanyTbl.kvk_nummer, self.CompanyTbl.naam]
         self.logger.info("Start writing table urls")
 
-        n_batch = int(len(record_list) / MAX_SQL_CHUNK) + 1
+        chunk_size = self.get_sql_chunk_size(n_columns=len(fields))
+        n_batch = int(len(record_list) / chunk_size) + 1
         wdg = PB_WIDGETS
         if self.progressbar:
             wdg[-1] = progress_bar_message(0, n_batch)
@@ -1196,9 +1619,11 @@ class KvKUrlParser(mp.Process):
             progress = None
 
         with self.database.atomic():
-            for cnt, batch in enumerate(pw.chunked(record_list, MAX_SQL_CHUNK)):
+            for cnt, batch in enumerate(pw.chunked(record_list, chunk_size)):
                 self.logger.info("Company chunk nr {}/{}".format(cnt + 1, n_batch))
-                self.CompanyTbl.insert_many(batch).execute()
+                # ignore the kvk numbers which are already present, such that a rerun does not
+                # fail on the primary key
+                self.insert_rows(self.CompanyTbl, fields, batch, ignore_conflicts=True)
                 if progress:
                     wdg[-1] = progress_bar_message(cnt, n_batch)
                     progress.update(cnt)
@@ -1217,25 +1642,21 @@ class KvKUrlParser(mp.Process):
             self.logger.debug("Empty urls data frame. Nothing to write")
             return
 
-        urls: pd.DataFrame = self.url_df[[URL_KEY, KVK_KEY]].copy()
-        urls.loc[:, KVK_KEY] = None
+        # the kvk number is not stored in the UrlNL table, so only the unique urls are needed.
+        # A hashed drop_duplicates, no sort is required for this
+        urls: pd.Series = self.url_df[URL_KEY].drop_duplicates()
 
-        urls.sort_values([URL_KEY, KVK_KEY], inplace=True)
+        # skip the urls already stored. Only the url column is fetched, as tuples
+        query = self.UrlNLTbl.select(self.UrlNLTbl.url).tuples()
+        urls_in_db = [url for (url,) in query.iterator()]
+        urls = urls[~urls.isin(urls_in_db).values]
 
-        urls.drop_duplicates([URL_KEY], inplace=True)
-
-        urls.set_index(URL_KEY, inplace=True, drop=True)
-
-        urls_in_db = [q.url for q in self.UrlNLTbl.select()]
-
-        urls.drop(urls_in_db, inplace=True)
-        urls.reset_index(inplace=True)
-
-        self.logger.info("Convert url dataframe to to list of dicts. This may take some time... ")
-        record_list = list(urls.to_dict(orient="index").values())
+        record_list = [(url,) for url in urls.tolist()]
+        fields = [self.UrlNLTbl.url]
         self.logger.info("Start writing table urls")
 
-        n_batch = int(len(record_list) / MAX_SQL_CHUNK) + 1
+        chunk_size = self.get_sql_chunk_size(n_columns=len(fields))
+        n_batch = int(len(record_list) / chunk_size) + 1
         wdg = PB_WIDGETS
         if self.progressbar:
             wdg[-1] = progress_bar_message(0, n_batch)
@@ -1244,9 +1665,9 @@ class KvKUrlParser(mp.Process):
             progress = None
 
         with self.database.atomic():
-            for cnt, batch in enumerate(pw.chunked(record_list, MAX_SQL_CHUNK)):
+            for cnt, batch in enumerate(pw.chunked(record_list, chunk_size)):
                 self.logger.info("UrlNL chunk nr {}/{}".format(cnt + 1, n_batch))
-                self.UrlNLTbl.insert_many(batch).execute()
+                self.insert_rows(self.UrlNLTbl, fields, batch, ignore_conflicts=True)
                 if progress:
                     wdg[-1] = progress_bar_message(cnt, n_batch)
                     progress.update(cnt)
@@ -1258,6 +1679,31 @@ class KvKUrlParser(mp.Process):
 
     # @profile
 
+    def get_company_id_frame(self):
+        """
+        Get the data frame with the company id belonging to each kvk number in the Company table
+
+        Returns
+        -------
+        pd.DataFrame:
+            Data frame with the columns KVK_KEY and COMPANY_KEY. As the kvk number is the primary
+            key of the Company table, both columns hold the same value
+
+        Notes
+        -----
+        * The kvk numbers are read from the Company table only the first time; the frame is
+          kept in *company_id_df* and reused by the other writers. Set *company_id_df* to None to
+          read the table again
+        """
+        if self.company_id_df is None:
+            kvk_query = self.CompanyTbl.select(self.CompanyTbl.kvk_nummer).tuples()
+            self.company_vs_kvk = np.fromiter(
+                (kvk_nummer for (kvk_nummer,) in kvk_query.iterator()), dtype=np.int64)
+            self.n_company = self.company_vs_kvk.size
+            self.company_id_df = pd.DataFrame({KVK_KEY: self.company_vs_kvk,
+                                               COMPANY_KEY: self.company_vs_kvk})
+        return self.company_id_df
+
     # @profile
     def urls_per_kvk_to_sql(self):
         """
@@ -1270,81 +1716,50 @@ class KvKUrlParser(mp.Process):
             return
 
         # create selection of data columns
-        urls = self.url_df[[KVK_KEY, URL_KEY, NAME_KEY]].sort_values([KVK_KEY])
-        # count the number of urls per kvk
-        n_url_per_kvk = urls.groupby(KVK_KEY)[KVK_KEY].count()
+        urls = self.url_df[[KVK_KEY, URL_KEY, NAME_KEY]]
 
         # add a company key to all url and then make a reference to all companies from the Company
-        # table
-        kvk_list = self.address_df[KVK_KEY].tolist()
-        self.company_vs_kvk = self.CompanyTbl.select().order_by(self.CompanyTbl.kvk_nummer)
-        self.n_company = self.company_vs_kvk.count()
+        # table. Only the kvk numbers are fetched; these are the primary key of the Company table
+        # and can therefore directly be used as value for the company foreign key. The companies
+        # have just been written, so read them again
+        self.company_id_df = None
+        company_id_df = self.get_company_id_frame()
 
-        kvk_comp_list = list()
-        for company in self.company_vs_kvk:
-            kvk_comp_list.append(int(company.kvk_nummer))
-        kvk_comp = set(kvk_comp_list)
-        kvk_not_in_addresses = set(kvk_list).difference(kvk_comp)
+        kvk_not_in_addresses = ~self.address_df[KVK_KEY].isin(self.company_vs_kvk)
 
         # in case there is one kvk not in the address data base, something is wrong,
         # as we took care of that in the merge_database routine
-        assert not kvk_not_in_addresses
+        assert not kvk_not_in_addresses.any()
 
         self.logger.info(f"Found: {self.n_company} companies")
-        wdg = PB_WIDGETS
-        if self.progressbar:
-            wdg[-1] = progress_bar_message(0, self.n_company)
-            progress = pb.ProgressBar(widgets=wdg, maxval=self.n_company, fd=sys.stdout).start()
-        else:
-            progress = None
-
-        company_list = list()
-        for counter, company in enumerate(self.company_vs_kvk):
-            kvk_nr = int(company.kvk_nummer)
-            # we need to check if this kvk is in de address list  still
-            if kvk_nr in kvk_not_in_addresses:
-                self.logger.debug(f"Skipping kvk {kvk_nr} as it is not in the addresses")
-                continue
-
-            try:
-                n_url = n_url_per_kvk.loc[kvk_nr]
-            except KeyError:
-                continue
 
-            # add the company number of url time to the list
-            company_list.extend([company] * n_url)
-
-            if progress:
-                wdg[-1] = progress_bar_message(counter, self.n_company, kvk_nr, company.naam)
-                progress.update(counter)
-            if counter % MAX_SQL_CHUNK == 0:
-                self.logger.info(" Added {} / {}".format(counter, self.n_company))
-        if progress:
-            progress.finish()
-
-        urls[COMPANY_KEY] = company_list
+        # attach the company id to all the urls with one inner merge, which also removes the
+        # urls of which the kvk is not in the Company table
+        urls = urls.merge(company_id_df, on=KVK_KEY, how="inner")
 
         # in case there is a None at a row, remove it (as there is not company found)
         urls.dropna(axis=0, inplace=True)
 
-        # the kvk key is already visible via the company_id
-        urls.drop([KVK_KEY], inplace=True, axis=1)
-
-        self.logger.info("Converting urls to dict. This make take some time...")
-        url_list = list(urls.to_dict(orient="index").values())
+        # the kvk key is already visible via the company_id, so only store the url and name
+        url_list = list(zip(urls[COMPANY_KEY].tolist(),
+                            urls[URL_KEY].tolist(),
+                            urls[NAME_KEY].tolist()))
+        fields = [self.WebsiteTbl.company, self.WebsiteTbl.url, self.WebsiteTbl.naam]
 
-        # turn the list of dictionaries into a sql table
-        self.logger.info("Start writing table urls")
-        n_batch = int(len(url_list) / MAX_SQL_CHUNK) + 1
+        # turn the list of tuples into a sql table
+        self.logger.info("Start writing table web sites")
+        chunk_size = self.get_sql_chunk_size(n_columns=len(fields))
+        n_batch = int(len(url_list) / chunk_size) + 1
+        wdg = PB_WIDGETS
         if self.progressbar:
             wdg[-1] = progress_bar_message(0, n_batch)
             progress = pb.ProgressBar(widgets=wdg, maxval=n_batch, fd=sys.stdout).start()
         else:
             progress = None
         with self.database.atomic():
-            for cnt, batch in enumerate(pw.chunked(url_list, MAX_SQL_CHUNK)):
+            for cnt, batch in enumerate(pw.chunked(url_list, chunk_size)):
                 self.logger.info("URL chunk nr {}/{}".format(cnt + 1, n_batch))
-                self.WebsiteTbl.insert_many(batch).execute()
+                self.insert_rows(self.WebsiteTbl, fields, batch)
                 if progress:
                     wdg[-1] = progress_bar_message(cnt, n_batch)
                     progress.update(cnt)
@@ -1365,67 +1780,38 @@ class KvKUrlParser(mp.Process):
             return
 
         # create selection of data columns
-        self.address_df[COMPANY_KEY] = None
-        columns = [KVK_KEY, NAME_KEY, ADDRESS_KEY, POSTAL_CODE_KEY, CITY_KEY, COMPANY_KEY]
-        df = self.address_df[columns].copy()
-        df.sort_values([KVK_KEY], inplace=True)
-        # count the number of urls per kvk
+        columns = [KVK_KEY, NAME_KEY, ADDRESS_KEY, POSTAL_CODE_KEY, CITY_KEY]
+        df = self.address_df[columns]
 
-        n_postcode_per_kvk = df.groupby(KVK_KEY)[KVK_KEY].count()
+        # attach the company id to all the addresses in the same way as done for the urls in
+        # urls_per_kvk_to_sql. The number of companies is known once the ids are read
+        df = df.merge(self.get_company_id_frame(), on=KVK_KEY, how="inner")
         self.logger.info(f"Found: {self.n_company} companies")
-        wdg = PB_WIDGETS
-        if self.progressbar:
-            wdg[-1] = progress_bar_message(0, self.n_company)
-            progress = pb.ProgressBar(widgets=wdg, maxval=self.n_company, fd=sys.stdout).start()
-        else:
-            progress = None
-
-        company_list = list()
-        for counter, company in enumerate(self.company_vs_kvk):
-            kvk_nr = int(company.kvk_nummer)
-            # we need to check if this kvk is in de address list  still
-
-            try:
-                n_postcode = n_postcode_per_kvk.loc[kvk_nr]
-            except KeyError:
-                continue
-
-            # add the company number of url time to the list
-            company_list.extend([company] * n_postcode)
-
-            if progress:
-                wdg[-1] = progress_bar_message(counter, self.n_company, kvk_nr, company.naam)
-                progress.update(counter)
-            if counter % MAX_SQL_CHUNK == 0:
-                self.logger.info(" Added {} / {}".format(counter, self.n_company))
-        if progress:
-            progress.finish()
-
-        df[COMPANY_KEY] = company_list
 
-        self.logger.info("Converting addresses to dict. This make take some time...")
-        address_list = list(df.to_dict(orient="index").values())
+        address_list = list(zip(*(df[col].tolist() for col in columns + [COMPANY_KEY])))
+        fields = [self.AddressTbl.kvk_nummer, self.AddressTbl.naam, self.AddressTbl.straat,
+                  self.AddressTbl.postcode, self.AddressTbl.plaats, self.AddressTbl.company]
 
-        # turn the list of dictionaries into a sql table
+        # turn the list of tuples into a sql table
         self.logger.info("Start writing table addresses")
-        n_batch = int(len(address_list) / MAX_SQL_CHUNK) + 1
+        chunk_size = self.get_sql_chunk_size(n_columns=len(fields))
+        n_batch = int(len(address_list) / chunk_size) + 1
+        wdg = PB_WIDGETS
         if self.progressbar:
-            wdg = PB_WIDGETS
-            wdg[-1] = progress_bar_message(0, self.n_company)
+            wdg[-1] = progress_bar_message(0, n_batch)
             progress = pb.ProgressBar(widgets=wdg, maxval=n_batch, fd=sys.stdout).start()
         else:
             progress = None
         with self.database.atomic():
-            for cnt, batch in enumerate(pw.chunked(address_list, MAX_SQL_CHUNK)):
+            for cnt, batch in enumerate(pw.chunked(address_list, chunk_size)):
                 self.logger.info("Address chunk nr {}/{}".format(cnt + 1, n_batch))
-                self.AddressTbl.insert_many(batch).execute()
+                self.insert_rows(self.AddressTbl, fields, batch)
                 if progress:
                     wdg[-1] = progress_bar_message(cnt, n_batch)
                     progress.update(cnt)
         if progress:
             progress.finish()
 
-
 class CompanyUrlMatch(object):
     """
     Take the company record as input and find the best matching url
@@ -1435,9 +1821,11 @@ class CompanyUrlMatch(object):
                  company_record,
                  kvk_nr: int = None,
                  company_name: str = None,
+                 company_name_small: str = None,
                  current_time: datetime.datetime = None,
                  company_urls_df: pd.DataFrame = None,
                  company_addresses_df: pd.DataFrame = None,
+                 company_postcodes: set = None,
                  urls_df: pd.DataFrame = None,
                  imposed_urls: dict = None,
                  distance_threshold: int = 10,
@@ -1491,9 +1879,11 @@ class CompanyUrlMatch(object):
         # first collect all the urls and obtain the match properties
         self.logger.debug("Get Url collection....")
         self.collection = UrlCollection(company_record, self.company_name, self.kvk_nr,
+                                        company_name_small=company_name_small,
                                         current_time=self.current_time,
                                         company_urls_df=self.company_urls_df,
-                                        company_addresses_df=company_addresses_df, urls_df=urls_df,
+                                        company_addresses_df=company_addresses_df,
+                                        company_postcodes=company_postcodes, urls_df=urls_df,
                                         threshold_distance=distance_threshold,
                                         threshold_string_match=string_match_threshold,
                                         impose_url=impose_url,
@@ -1557,9 +1947,11 @@ class UrlCollection(object):
                  company_record,
                  company_name: str,
                  kvk_nr: int,
+                 company_name_small: str = None,
                  current_time=None,
                  company_urls_df: pd.DataFrame = None,
                  company_addresses_df: pd.DataFrame = None,
+                 company_postcodes: set = None,
                  urls_df: pd.DataFrame = None,
                  threshold_distance: int = 10,
                  threshold_string_match: float = 0.5,
@@ -1571,7 +1963,7 @@ class UrlCollection(object):
                  force_ssl_check: bool = True,
                  older_time: datetime.timedelta = None,
                  timezone: pytz.timezone = None,
-                 exclude_extensions: pd.DataFrame = None,
+                 exclude_extensions: frozenset = None,
                  filter_urls: list = None,
                  force_process: bool = False,
                  rescan_missing_urls: bool = False,
@@ -1587,7 +1979,11 @@ class UrlCollection(object):
         self.force_process = force_process
         self.rescan_missing_urls = rescan_missing_urls
         self.timezone = timezone
-        self.exclude_extensions = exclude_extensions
+        # a set of suffixes, such that the check per url is a hashed lookup
+        if exclude_extensions is None:
+            self.exclude_extensions = EXCLUDED_EXTENSIONS
+        else:
+            self.exclude_extensions = frozenset(exclude_extensions)
         self.filter_urls = filter_urls
         self.current_time = current_time
 
@@ -1603,17 +1999,22 @@ class UrlCollection(object):
         self.company_name = company_name
         self.company_urls_df = company_urls_df
         self.company_addresses_df = company_addresses_df
-        self.company_name_small = clean_name(self.company_name)
+        if isinstance(company_name_small, str):
+            # the name has been cleaned already for all companies at once
+            self.company_name_small = company_name_small
+        else:
+            self.company_name_small = clean_name(self.company_name)
         self.urls_df = urls_df
+        # the urls of a company are scraped in parallel threads, which all update urls_df
+        self.urls_df_lock = threading.Lock()
 
-        self.postcodes = list()
-        postcodes = self.company_addresses_df[POSTAL_CODE_KEY]
-        is_valid_post_code = list(map(is_postcode, postcodes))
-        postcodes = postcodes[is_valid_post_code]
-        if postcodes.size > 0:
-            self.postcodes = set(postcodes)
+        if company_postcodes is not None:
+            # the valid post codes have been collected already for all companies at once
+            self.postcodes = company_postcodes
         else:
-            self.postcodes = set()
+            postcodes = self.company_addresses_df[POSTAL_CODE_KEY]
+            is_valid_post_code = list(map(is_postcode, postcodes))
+            self.postcodes = set(postcodes[is_valid_post_code])
 
         self.threshold_distance = threshold_distance
         self.threshold_string_match = threshold_string_match
@@ -1689,7 +2090,8 @@ class UrlCollection(object):
 
         schema = None
         ssl_valid = None
-        url_prop = self.urls_df.loc[url, :]
+        with self.urls_df_lock:
+            url_prop = self.urls_df.loc[url, :]
         if url_prop[BESTAAT_KEY] is not None and not url_prop[BESTAAT_KEY]:
             logger.warning(f"Url {url} does not exist based on the previous run. Don't scrape")
             scrape_url = False
@@ -1710,11 +2112,7 @@ class UrlCollection(object):
                 scrape_url = False
 
         url_analyse = UrlSearchStrings(url,
-                                       search_strings={
-                                           POSTAL_CODE_KEY: ZIP_REGEXP,
-                                           KVK_KEY: KVK_REGEXP,
-                                           BTW_KEY: BTW_REGEXP
-                                       },
+                                       search_strings=SEARCH_STRINGS,
                                        sort_order_hrefs=SORT_ORDER_HREFS,
                                        stop_search_on_found_keys=[BTW_KEY],
                                        store_page_to_cache=self.store_html_to_cache,
@@ -1755,7 +2153,7 @@ class UrlCollection(object):
             all_social_media = [sm.lower() for sm in SOCIAL_MEDIA]
             all_ecommerce = [ec.lower() for ec in PAY_OPTIONS]
             for external_url in url_analyse.external_hrefs:
-                dom = tldextract.extract(external_url).domain
+                dom = tld_extract(external_url).domain
                 if dom in all_social_media and dom not in sm_list:
                     logger.debug(f"Found social media {dom}")
                     sm_list.append(dom)
@@ -1764,29 +2162,64 @@ class UrlCollection(object):
                     ec_list.append(dom)
             url_info.ecommerce = ec_list
             url_info.social_media = sm_list
+
+            # collect the new values of this url first and write them with one assignment
+            url_update = dict()
             if ec_list:
-                self.urls_df.loc[url, ECOMMERCE_KEY] = \
-                    paste_strings(ec_list, max_length=MAX_CHARFIELD_LENGTH)
+                url_update[ECOMMERCE_KEY] = paste_strings(ec_list, max_length=MAX_CHARFIELD_LENGTH)
             if sm_list:
-                self.urls_df.loc[url, SOCIAL_MEDIA_KEY] = \
-                    paste_strings(sm_list, max_length=MAX_CHARFIELD_LENGTH)
+                url_update[SOCIAL_MEDIA_KEY] = paste_strings(sm_list,
+                                                             max_length=MAX_CHARFIELD_LENGTH)
 
             if url_analyse.exists is not None and url_analyse.exists:
-                self.urls_df.loc[url, BESTAAT_KEY] = True
-                self.urls_df.loc[url, SSL_KEY] = url_analyse.req.ssl
-                self.urls_df.loc[url, SSL_VALID_KEY] = url_analyse.req.ssl_valid
+                url_update[BESTAAT_KEY] = True
+                url_update[SSL_KEY] = url_analyse.req.ssl
+                url_update[SSL_VALID_KEY] = url_analyse.req.ssl_valid
+
+            if url_update:
+                with self.urls_df_lock:
+                    self.urls_df.loc[url, list(url_update.keys())] = list(url_update.values())
 
         return url_analyse
 
+    def scrape_urls(self, url_infos):
+        """
+        Scrape the urls of the company in parallel threads
+
+        Parameters
+        ----------
+        url_infos: list
+            The UrlInfo objects of the urls to scrape
+
+        Returns
+        -------
+        list:
+            The UrlSearchStrings result per url, in the same order as *url_infos*
+        """
+        n_threads = min(len(url_infos), MAX_SCRAPE_THREADS)
+        if n_threads <= 1:
+            return [self.scrape_url_and_store_in_dataframes(url_info.url, url_info)
+                    for url_info in url_infos]
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            return list(executor.map(
+                lambda url_info: self.scrape_url_and_store_in_dataframes(url_info.url, url_info),
+                url_infos))
+
     def collect_web_sites(self):
         """
         Collect all the web sites of a company, scrape the contents to find info, get the
         best matching web site to the company
         """
-        min_distance = None
-        max_sequence_match = None
-        index_string_match = index_distance = None
         self.collection = collections.OrderedDict()
+
+        # compare the company name with the domains of all the urls of this company at once
+        urls = [url for url in self.company_urls_df[URL_KEY] if url is not None and url != ""]
+        distances, string_matches = get_name_matches(self.company_name_small,
+                                                     [tld_extract(url) for url in urls])
+        name_matches = dict(zip(urls, zip(distances, string_matches)))
+
+        url_infos = list()
         for i_web, web_row in self.company_urls_df.iterrows():
             # get the url first from the websites table which list all the urls belonging to
             # one kvk search
@@ -1808,7 +2241,7 @@ class UrlCollection(object):
 
             # quick check if we can processes this url based on the country code
             suffix = url_info.url_extract.suffix
-            if suffix in self.exclude_extensions.index:
+            if suffix in self.exclude_extensions:
                 url_info.outside_nl = True
                 logger.info(f"Web site {url} has suffix '.{suffix}' Continue ")
 
@@ -1830,7 +2263,18 @@ class UrlCollection(object):
             else:
                 url_info.processing_time = processing_time
 
-            url_analyse = self.scrape_url_and_store_in_dataframes(url, url_info)
+            url_infos.append(url_info)
+
+        # the scraping is waiting for the web sites most of the time, so scrape the urls of this
+        # company in parallel threads. The ranking below is done in the original order
+        url_analyses = self.scrape_urls(url_infos)
+
+        ranked_index = list()
+        ranked_distances = list()
+        ranked_string_matches = list()
+        for url_info, url_analyse in zip(url_infos, url_analyses):
+            url = url_info.url
+            i_web = url_info.index
 
             url_info.url_analyse = url_analyse
 
@@ -1840,8 +2284,11 @@ class UrlCollection(object):
 
             # based on the company postcodes and kvknummer and web contents, make a ranking how
             # good the web sides matches the company
+            distance, string_match = name_matches[url]
             match = UrlCompanyRanking(url, self.company_name_small,
                                       url_extract=url_info.url_extract,
+                                      distance=distance,
+                                      string_match=string_match,
                                       url_analyse=url_analyse,
                                       company_kvk_nummer=self.kvk_nr,
                                       company_postcodes=self.postcodes,
@@ -1850,22 +2297,21 @@ class UrlCollection(object):
                                       logger=self.logger)
 
             url_info.match = match
-
-            # update the min max
-            if min_distance is None or match.distance < min_distance:
-                index_distance = i_web
-                min_distance = match.distance
-
-            if max_sequence_match is None or match.string_match > max_sequence_match:
-                index_string_match = i_web
-                max_sequence_match = match.string_match
+            ranked_index.append(i_web)
+            ranked_distances.append(match.distance)
+            ranked_string_matches.append(match.string_match)
 
             self.logger.debug("   * {} - {}  - {}".format(url, match.ext.domain,
                                                           match.distance))
 
-        if min_distance is None:
+        if not ranked_index:
             self.company_urls_df = None
-        elif index_string_match != index_distance:
+            return
+
+        # get the minimum distance and maximum string match after the loop in one go
+        index_distance = ranked_index[int(np.argmin(ranked_distances))]
+        index_string_match = ranked_index[int(np.argmax(ranked_string_matches))]
+        if index_string_match != index_distance:
             self.logger.warning(
                 "Found minimal distance for {}: {}\nwhich differs from "
                 "best string match {}: {}".format(index_distance,
@@ -1878,23 +2324,46 @@ class UrlCollection(object):
         From all the web sites stored in the data frame web_df, get the best match
         """
 
-        # first fill the web_df columns we need for ranking
-        for i_web, (url_key, url_info) in enumerate(self.collection.items()):
-            index = url_info.index
+        # first collect the values of the columns we need for ranking per web site, and then
+        # fill the columns of all web sites at once, instead of setting each cell with loc.
+        # The columns get a numeric or boolean dtype, such that the masks below do not need to
+        # compare python objects. The web sites which are not analysed now (empty, filtered or
+        # without analyse) keep the values they already had in the websites table. A missing
+        # distance becomes the int32 maximum, so it never gives the minimum distance
+        df = self.company_urls_df
+        urls = df[URL_KEY].to_numpy(dtype=object, copy=True)
+        exists = typed_column_values(df, EXISTS_KEY, False, bool)
+        has_postcode = typed_column_values(df, HAS_POSTCODE_KEY, False, bool)
+        has_kvk_nr = typed_column_values(df, HAS_KVK_NR, False, bool)
+        distance = typed_column_values(df, DISTANCE_KEY, np.iinfo(np.int32).max, np.int32)
+        string_match = typed_column_values(df, STRING_MATCH_KEY, np.nan, np.float64)
+        ranking = typed_column_values(df, RANKING_KEY, np.nan, np.float64)
+        url_match = typed_column_values(df, DISTANCE_STRING_MATCH_KEY, np.nan, np.float64)
+        positions = dict(zip(df.index, range(len(df.index))))
+        for url_key, url_info in self.collection.items():
             if url_info.url_analyse is None:
                 logger.warning("url {url_key} yielded None analyse. Skip to next")
                 continue
-            exists = url_info.url_analyse.exists
-            self.company_urls_df.loc[index, URL_KEY] = url_info.url
-            self.company_urls_df.loc[index, EXISTS_KEY] = exists
-            if exists:
-                self.company_urls_df.loc[index, DISTANCE_KEY] = url_info.match.distance
-                self.company_urls_df.loc[index, STRING_MATCH_KEY] = url_info.match.string_match
-                self.company_urls_df.loc[index, HAS_POSTCODE_KEY] = url_info.match.has_postcode
-                self.company_urls_df.loc[index, HAS_KVK_NR] = url_info.match.has_kvk_nummer
-                self.company_urls_df.loc[index, RANKING_KEY] = url_info.match.ranking
-                self.company_urls_df.loc[index, DISTANCE_STRING_MATCH_KEY] = \
-                    url_info.match.url_match
+            pos = positions[url_info.index]
+            urls[pos] = url_info.url
+            exists[pos] = bool(url_info.url_analyse.exists)
+            if exists[pos]:
+                match = url_info.match
+                distance[pos] = match.distance
+                string_match[pos] = match.string_match
+                has_postcode[pos] = match.has_postcode
+                has_kvk_nr[pos] = match.has_kvk_nummer
+                ranking[pos] = match.ranking
+                url_match[pos] = match.url_match
+        self.company_urls_df = df.assign(**{
+            URL_KEY: urls,
+            EXISTS_KEY: exists,
+            DISTANCE_KEY: distance,
+            STRING_MATCH_KEY: string_match,
+            HAS_POSTCODE_KEY: has_postcode,
+            HAS_KVK_NR: has_kvk_nr,
+            RANKING_KEY: ranking,
+            DISTANCE_STRING_MATCH_KEY: url_match})
 
         # only select the web site which exist
         mask = self.company_urls_df[EXISTS_KEY]
@@ -25,8 +25,10 @@ not to profiling
 """
 
 import argparse
+import contextlib
 import datetime
-import dateutil
+import dateutil.parser
+import functools
 import getpass
 import logging
 import logging.config
@@ -38,16 +40,10 @@ import time
 from pathlib import Path
 import pytz
 
-import pandas as pd
 import pytimeparse
-import yaml
 
-from cbs_utils import Q_
-from cbs_utils.misc import (Chdir, make_directory)
 from kvk_url_finder import LOGGER_BASE_NAME, CACHE_DIRECTORY
-from kvk_url_finder.kvk_engine import KvKUrlParser
-from kvk_url_finder.models import DATABASE_TYPES
-from kvk_url_finder.utils import (setup_logging, merge_external_database, read_database_selection)
+from kvk_url_finder.models import DATABASE_TYPES, SQL_BATCH_SIZE
 
 try:
     from kvk_url_finder import __version__
@@ -55,6 +51,95 @@ except ModuleNotFoundError:
     __version__ = "unknown"
 
 
+def _version_message():
+    """ The message shown with the --version option """
+    return "{}\nPart of kvk_url_finder version {}".format(os.path.basename(__file__), __version__)
+
+
+def _freeze(value):
+    """ Turn a (nested) argument into something hashable. Raises TypeError if not possible """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(val)) for key, val in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(val) for val in value)
+    hash(value)
+    return value
+
+
+def _file_stamp(file_name):
+    """ The modification time and size of a file, or None if it does not exist """
+    try:
+        stat = os.stat(file_name)
+    except (TypeError, OSError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _ParserArguments(object):
+    """
+    Hashable wrapper around the keyword arguments of the KvKUrlParser
+
+    Two sets of arguments are equal if all the arguments and the time stamps of the input files
+    are equal. The original arguments are kept such that the parser receives them unchanged
+    """
+
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.key = (_freeze(kwargs),
+                    _file_stamp(kwargs.get("address_input_file_name")),
+                    _file_stamp(kwargs.get("url_input_file_name")))
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _ParserArguments) and self.key == other.key
+
+
+@functools.lru_cache(maxsize=4)
+def _get_cached_parser(parser_arguments):
+    from kvk_url_finder.kvk_engine import KvKUrlParser
+    return KvKUrlParser(**parser_arguments.kwargs)
+
+
+def _get_parser(**kwargs):
+    """
+    Get a KvKUrlParser for these arguments, reusing the one of a previous call if possible
+
+    Parameters
+    ----------
+    kwargs:
+        The keyword arguments passed to the KvKUrlParser
+
+    Returns
+    -------
+    KvKUrlParser:
+        The parser. If *main* is called multiple times in the same process with the same
+        arguments, the parser of the previous call is reused, such that the database and its
+        tables do not have to be set up again
+
+    Notes
+    -----
+    * A parser which resets the database is never reused
+    * At the end of *main* the parser releases its data frames and closes its database
+      connection, so a cached parser does not keep the data of the previous run in memory
+    * The arguments should be hashable after turning the dicts and lists into tuples. If not,
+      a new parser is created
+    """
+    from kvk_url_finder.kvk_engine import KvKUrlParser
+    if kwargs.get("reset_database"):
+        return KvKUrlParser(**kwargs)
+    try:
+        parser_arguments = _ParserArguments(kwargs)
+    except TypeError:
+        return KvKUrlParser(**kwargs)
+
+    kvk_parser = _get_cached_parser(parser_arguments)
+    # a reused parser should compare with the time of this run
+    kvk_parser.current_time = datetime.datetime.now(pytz.timezone(kvk_parser.timezone))
+    return kvk_parser
+
+
 def _parse_the_command_line_arguments(args):
     def check_positive(value):
         """ local function to test if an argument is larger than zero"""
@@ -80,9 +165,8 @@ def _parse_the_command_line_arguments(args):
     # mandatory arguments
     parser.add_argument("configuration_file", action="store",
                         help="The yaml settings file")
-    parser.add_argument("--version", help="Show the current version", action="version",
-                        version="{}\nPart of kvk_url_finder version {}".format(
-                            os.path.basename(__file__), __version__))
+    parser.add_argument("-V", "--version", help="Show the current version", action="version",
+                        version=_version_message())
     parser.add_argument('-d', '--debug', help="Print lots of debugging statements",
                         action="store_const", dest="log_level", const=logging.DEBUG,
                         default=logging.INFO)
@@ -126,7 +210,11 @@ def _parse_the_command_line_arguments(args):
     parser.add_argument("--kvk_stop", type=int,
                         help="Stop processing at this kvk number. This overrules the setting in"
                              "the yaml file if given")
-    parser.add_argument("--n_processes", type=check_positive, help="Number of processes to run",
+    parser.add_argument("--n_processes", type=check_positive,
+                        help="Number of processes to run. The kvk range is split into this number "
+                             "of sub ranges which are matched in parallel, each process writing "
+                             "its own results to the database. As the matching is mostly waiting "
+                             "for the web sites, more processes than cores can be used",
                         default=1)
     parser.add_argument("--max_entries", type=check_positive,
                         help="Maximum number of kvk entries to process")
@@ -160,6 +248,22 @@ def _parse_the_command_line_arguments(args):
                         help="Force to check the ssl https schame. If false (default) try"
                              "to get it from previous run")
     parser.add_argument("--timezone", default="Europe/Amsterdam", help="Specify the time zone")
+    parser.add_argument("--sql_batch_size", type=check_positive, default=SQL_BATCH_SIZE,
+                        help="Number of records written to the sql tables with one statement")
+    parser.add_argument("--csv_chunk_size", type=check_positive, default=100000,
+                        help="Number of lines read at once from the csv input files")
+    parser.add_argument("--csv_engine", choices=("pandas", "pyarrow"),
+                        help="Reader to use for the csv input files. Both read the file in chunks "
+                             "of --csv_chunk_size lines. The pyarrow reader is faster but "
+                             "requires pyarrow to be installed. If not given, "
+                             "pyarrow is used if installed, otherwise pandas")
+    parser.add_argument("--decompress_threads", type=check_positive,
+                        help="Number of threads to decompress bz2 input files with. Only used if "
+                             "indexed_bzip2 is installed. If not given, all cores are used")
+    parser.add_argument("--validate_config", action="store_true",
+                        help="Only read and check the configuration file and exit. Exits with "
+                             "an error if fastjsonschema is not installed, as the configuration "
+                             "can then not be checked")
 
     # parse the command line
     parsed_arguments = parser.parse_args(args)
@@ -168,12 +272,37 @@ def _parse_the_command_line_arguments(args):
 
 
 def main(args_in):
+    if len(args_in) == 1 and args_in[0] in ("-V", "--version"):
+        # no need to build the argument parser just to show the version
+        print(_version_message())
+        return
+
     args, parser = _parse_the_command_line_arguments(args_in)
 
+    # the heavy modules are imported only after the command line has been parsed, such that
+    # calling the script with --help or --version does not have to wait for them
+    from cbs_utils import Q_
+    from cbs_utils.misc import Chdir
+    from kvk_url_finder.utils import (setup_logging, merge_external_database,
+                                      read_database_selection, load_settings_cached,
+                                      validate_settings, settings_validation_available,
+                                      ensure_directory)
+
+    if args.validate_config:
+        # only parse and check the settings; no need to start the engine or to write the cache
+        settings = load_settings_cached(args.configuration_file, use_cache=False)
+        if not settings_validation_available():
+            sys.exit("Configuration file {} could be read, but the schema validation is skipped "
+                     "because fastjsonschema is not installed".format(args.configuration_file))
+        validate_settings(settings)
+        print("Configuration file {} is OK".format(args.configuration_file))
+        return
+
     # with the global statement line we make sure to change the global variable at the top
     # when settings gup the logger
-    with open(args.configuration_file, "r") as stream:
-        settings = yaml.load(stream=stream, Loader=yaml.FullLoader)
+    settings = validate_settings(load_settings_cached(args.configuration_file))
+
+    from kvk_url_finder.kvk_engine import KvKUrlParser
 
     general = settings["general"]
     working_directory = general["working_directory"][platform.system()]
@@ -204,7 +333,7 @@ def main(args_in):
             current_time = datetime.datetime.now(timezone)
             other_time = dateutil.parser.parse(older_time_str).astimezone(timezone)
             delta_time = current_time - other_time
-            older_time_in_secs = delta_time / pd.to_timedelta(1, 's')
+            older_time_in_secs = delta_time.total_seconds()
         # convert delta time to differnce in seconds
         older_time = datetime.timedelta(seconds=older_time_in_secs)
 
@@ -274,7 +403,7 @@ def main(args_in):
 
     # create the KvKUrl object, but first move to the working directory, so everything we do
     # is with respect to this directory
-    with Chdir(working_directory) as _:
+    with Chdir(working_directory) as _, contextlib.ExitStack() as exit_stack:
 
         logger = setup_logging(
             write_log_to_file=args.write_log_to_file,
@@ -283,11 +412,16 @@ def main(args_in):
             log_level=args.log_level,
             progress_bar=args.progressbar
         )
-        logger.debug("Enter run with python version {}".format(sys.base_prefix))
-        logger.debug("ARGV_IN: {}".format(" ".join(args_in)))
-        args_str = ["{}:{}".format(at, getattr(args, at)) for at in dir(args) if
-                    not None and not at.startswith("_")]
-        logger.debug("ARGV: {}".format(" ".join(args_str)))
+        # report the run in one record; the argument list is only built if it is going to be
+        # shown
+        if logger.isEnabledFor(logging.DEBUG):
+            args_str = ["{}:{}".format(at, getattr(args, at)) for at in dir(args) if
+                        not None and not at.startswith("_")]
+            logger.debug("\n".join([
+                "Enter run with python version {}".format(sys.base_prefix),
+                "ARGV_IN: {}".format(" ".join(args_in)),
+                "ARGV: {}".format(" ".join(args_str))
+            ]))
 
         # check if we want to take a selection by looking in the selection section of the yaml
         # file or by looking at the command line arguments
@@ -331,10 +465,8 @@ def main(args_in):
         if platform.system() == "Windows":
             script_name += ".exe"
 
-        start_time = pd.to_datetime("now")
-        message = "Start {script} (v: {version}) at {start_time}:\n{cmd}" \
-                  "".format(script=script_name, version=__version__,
-                            start_time=start_time, cmd=sys.argv[:])
+        start_time = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+        message = f"Start {script_name} (v: {__version__}) at {start_time}:\n{sys.argv[:]}"
         if not args.progressbar:
             logger.info(message)
         else:
@@ -345,8 +477,8 @@ def main(args_in):
             logger.setLevel(logging.INFO)
 
         # make the directories in case they do not exist yet
-        make_directory(CACHE_DIRECTORY)
-        make_directory(output_directory)
+        ensure_directory(CACHE_DIRECTORY)
+        ensure_directory(output_directory)
 
         if args.user is not None:
             user = args.user
@@ -365,7 +497,7 @@ def main(args_in):
 
         # get the list of kvk number from the database. In case a data base is empty, it is
         # created from the input files
-        kvk_parser = KvKUrlParser(
+        kvk_parser = _get_parser(
             database_name=database_name,
             database_type=database_type,
             store_html_to_cache=store_html_to_cache,
@@ -391,8 +523,15 @@ def main(args_in):
             older_time=older_time,
             filter_urls=filter_urls,
             filter_kvks=filter_kvks,
-            rescan_missing_urls=args.rescan_missing_urls
+            rescan_missing_urls=args.rescan_missing_urls,
+            sql_batch_size=args.sql_batch_size,
+            csv_chunk_size=args.csv_chunk_size,
+            csv_engine=args.csv_engine,
+            decompress_threads=args.decompress_threads
         )
+        # the parser may be kept for a next call of main, so do not hold on to its data and
+        # database connection after this run, also not if we leave with sys.exit
+        exit_stack.callback(kvk_parser.release)
 
         if args.dumpdb:
             logger.info("Dumping database to {}".format(args.dumpdb))
@@ -439,6 +578,8 @@ def main(args_in):
 
         # create the object and do you thing
         jobs = list()
+        # the url table read by the first process is passed on to the next ones
+        shared_url_df = None
         for i_proc, kvk_range in enumerate(kvk_parser.kvk_ranges):
 
             if use_subprocess:
@@ -493,7 +634,8 @@ def main(args_in):
                 )
                 # populate the dataframes again, now including all tables
                 logger.debug("Populating dataframes for second time")
-                kvk_sub_parser.populate_dataframes()
+                kvk_sub_parser.populate_dataframes(url_df=shared_url_df)
+                shared_url_df = kvk_sub_parser.url_df
 
                 if args.n_processes > 1:
                     # we should not be running on windows if we are here
@@ -529,6 +671,23 @@ def main(args_in):
         logger.debug("Really:-)")
 
 
+def run_once(args_in):
+    """
+    Run the kvk_url_finder from python with a list of command line arguments
+
+    Parameters
+    ----------
+    args_in: list
+        The command line arguments, e.g. ["--configuration_file", "settings.yml"]
+
+    Notes
+    -----
+    * Calling this function repeatedly in the same process reuses the parser of the previous
+      call, as long as the arguments and input files did not change
+    """
+    main(args_in)
+
+
 def _run():
     """Entry point for console_scripts
     """
@@ -279,3 +279,8 @@ COUNTRY_EXTENSIONS = [
     [False, "Zambia", "zm"],
     [False, "Zimbabwe", "zw"],
 ]
+
+# the url extensions of the countries which we want to exclude. Some suffixes in the list above
+# have a trailing space, so strip them
+EXCLUDED_EXTENSIONS = frozenset(suffix.strip() for include, country, suffix in COUNTRY_EXTENSIONS
+                                if not include)
@@ -1,5 +1,6 @@
 from pathlib import Path
 import logging
+import sqlite3
 
 import peewee as pw
 from playhouse.pool import (PooledPostgresqlExtDatabase)
@@ -23,6 +24,12 @@ STRING_MATCH_KEY = "string_match"
 RANKING_KEY = "ranking"
 MAX_PROCESSES = 128
 MAX_CHARFIELD_LENGTH = 4095
+# default number of records written to the sql tables with one insert statement
+SQL_BATCH_SIZE = 10000
+# maximum number of variables in one sqlite statement. This limits the number of records we can
+# insert with one statement. Postgres allows at most 65535 parameters per statement
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+MAX_SQL_PARAMETERS = 65535
 
 GETEST_KEY = "getest"
 BESTAAT_KEY = "bestaat"
@@ -112,14 +119,19 @@ logger = logging.getLogger(__name__)
 
 def init_database(database_name: Path,
                   database_type="postgres", user="postgres",
-                  password=None, host="localhost", port=5432):
+                  password=None, host="localhost", port=5432, timezone=None):
     assert database_type in DATABASE_TYPES
     if database_type == "postgres":
         logger.debug(f"Opening postgres database {database_name}\n"
                      f"user={user}; host={host} port={port}")
+        connect_kwargs = dict()
+        if timezone is not None:
+            # let the server set the time zone when the connection is made, such that each pooled
+            # connection has it without an extra statement
+            connect_kwargs["options"] = "-c timezone={}".format(timezone)
         db = PooledPostgresqlExtDatabase(
             database_name, user=user, host=host, port=port, password=password,
-            max_connections=MAX_PROCESSES, stale_timeout=300)
+            max_connections=MAX_PROCESSES, stale_timeout=300, **connect_kwargs)
     elif database_type == "sqlite":
         db = pw.SqliteDatabase(str(database_name), pragmas=PRAGMAS)
     else:
@@ -127,6 +139,32 @@ def init_database(database_name: Path,
     return db
 
 
+def get_sql_chunk_size(database, n_columns, sql_batch_size=SQL_BATCH_SIZE):
+    """
+    Get the number of records which are inserted into the database with one statement
+
+    Parameters
+    ----------
+    database: peewee.Database
+        The database the records are written to
+    n_columns: int
+        Number of columns per record
+    sql_batch_size: int
+        The requested number of records per statement
+
+    Returns
+    -------
+    int:
+        The sql batch size, limited by the maximum number of variables the database allows in
+        one statement
+    """
+    if isinstance(database, pw.SqliteDatabase):
+        max_variables = SQLITE_MAX_VARIABLES
+    else:
+        max_variables = MAX_SQL_PARAMETERS
+    return max(min(sql_batch_size, max_variables // n_columns), 1)
+
+
 class UnknownField(object):
     def __init__(self, *_, **__): pass
 
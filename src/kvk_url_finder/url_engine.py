@@ -1,23 +1,22 @@
 import datetime
 import multiprocessing as mp
 import os
-import re
 import sys
 import time
 
+import numpy as np
 import pandas as pd
 import progressbar as pb
 import pytz
-import tldextract
 from tqdm import tqdm
 
 from cbs_utils.misc import (create_logger, print_banner, standard_postcode)
-from cbs_utils.web_scraping import (UrlSearchStrings, BTW_REGEXP, ZIP_REGEXP, KVK_REGEXP,
-                                    get_clean_url)
+from cbs_utils.web_scraping import (UrlSearchStrings, get_clean_url)
 from kvk_url_finder import LOGGER_BASE_NAME
-from kvk_url_finder.model_variables import COUNTRY_EXTENSIONS, SORT_ORDER_HREFS
+from kvk_url_finder.model_variables import EXCLUDED_EXTENSIONS, SORT_ORDER_HREFS
 from kvk_url_finder.models import *
-from kvk_url_finder.utils import (Range, check_if_url_needs_update, paste_strings)
+from kvk_url_finder.utils import (Range, check_if_url_needs_update, paste_strings, tld_extract,
+                                  SEARCH_STRINGS)
 
 try:
     from kvk_url_finder import __version__
@@ -47,8 +46,12 @@ COMPRESSION_TYPES = [None, "zlib", "blosc"]
 SCRAPERS = ["bs4", "scrapy"]
 
 MAX_SQL_CHUNK = 500
+# number of url records fetched at once from the database while scraping
+URL_WINDOW_SIZE = MAX_SQL_CHUNK
 
 STOP_FILE = "stop"
+# number of records processed between two checks for the stop file
+STOP_FILE_CHECK_INTERVAL = 64
 
 # set up progress bar properties
 PB_WIDGETS = [pb.Percentage(), ' ', pb.Bar(marker='.', left='[', right=']'), ""]
@@ -88,6 +91,8 @@ class UrlParser(mp.Process):
         Give the maximum number of entries to process. Default = None, which means all entries are
         used. For a finite number of entries the maximum number of rows read from the csv file is
         limited to 'maximum_entries'
+    sql_batch_size: int
+        Number of records written to the sql tables with one insert statement. Default = 10000
     """
 
     def __init__(self,
@@ -119,7 +124,8 @@ class UrlParser(mp.Process):
                  log_level_file=logging.DEBUG,
                  older_time: datetime.timedelta = None,
                  timezone: pytz.timezone = 'Europe/Amsterdam',
-                 filter_urls: list = None
+                 filter_urls: list = None,
+                 sql_batch_size: int = SQL_BATCH_SIZE
                  ):
 
         # launch the process
@@ -152,12 +158,11 @@ class UrlParser(mp.Process):
             # in case the single bar option is given, we only show the bar of the first process
             self.showbar = False
 
-        # a list of all country url extension which we want to exclude
-        self.exclude_extensions = pd.DataFrame(COUNTRY_EXTENSIONS,
-                                               columns=["include", "country", "suffix"])
-        self.exclude_extensions = self.exclude_extensions[~self.exclude_extensions["include"]]
-        self.exclude_extensions = self.exclude_extensions.set_index("suffix", drop=True).drop(
-            ["include"], axis=1)
+        # a set of all country url extension which we want to exclude
+        if exclude_extensions is None:
+            self.exclude_extensions = EXCLUDED_EXTENSIONS
+        else:
+            self.exclude_extensions = frozenset(exclude_extensions)
 
         self.i_proc = i_proc
         self.store_html_to_cache = store_html_to_cache
@@ -200,13 +205,14 @@ class UrlParser(mp.Process):
         self.n_company = None
 
         self.number_of_processes = number_of_processes
+        self.sql_batch_size = sql_batch_size
 
         self.url_range_process = Range(url_range_process)
         self.url_ranges = None
 
         self.database = init_database(database_name, database_type=database_type,
-                                      user=user, password=password, host=hostname)
-        self.database.execute_sql("SET TIME ZONE '{}'".format(self.timezone))
+                                      user=user, password=password, host=hostname,
+                                      timezone=self.timezone)
         tables = init_models(self.database)
         self.UrlNL = tables[0]
         self.company = tables[1]
@@ -247,75 +253,79 @@ class UrlParser(mp.Process):
 
     def get_url_list_per_process(self):
         """
-        Get a list of kvk numbers in the query
-        """
-        query = (self.UrlNL.select(self.UrlNL.url, self.UrlNL.kvk_nummer, self.UrlNL.btw_nummer,
-                                   self.UrlNL.datetime)
-                 .order_by(self.UrlNL.url))
-        url_to_process = list()
-        number_in_range = 0
-        if self.start_url is None:
-            process_url = True
-        else:
-            process_url = False
-        for q in query:
-            if self.maximum_entries is not None and number_in_range >= self.maximum_entries:
-                # maximum entries reached
-                break
-            url = q.url
-            if self.start_url is not None and url == self.start_url:
-                process_url = True
-            if self.stop_url is not None and url == self.stop_url:
-                process_url = False
-
-            if not process_url:
-                continue
+        Get the list of urls to process and divide it in a range per process
 
+        Notes
+        -----
+        * The range runs from *start_url* up to (not including) *stop_url*
+        * Only the urls which need an update (see check_if_url_needs_update) are selected, unless
+          *force_process* is True
+        """
+        query = self.UrlNL.select(self.UrlNL.url)
+        if self.start_url is not None:
+            query = query.where(self.UrlNL.url >= self.start_url)
+        if self.stop_url is not None:
+            query = query.where(self.UrlNL.url < self.stop_url)
+        if self.older_time and not self.force_process:
             now = datetime.datetime.now(pytz.timezone(self.timezone))
-            processing_time = q.datetime
-            url_needs_update = check_if_url_needs_update(processing_time=processing_time,
-                                                         current_time=now,
-                                                         older_time=self.older_time)
-            if url_needs_update or self.force_process:
-                logger.debug(f"Adding {url} to the list")
-                # we can processes this record, so add it to the list
-                url_to_process.append(url)
-                number_in_range += 1
+            query = query.where(self.UrlNL.datetime.is_null() |
+                                (self.UrlNL.datetime <= now - self.older_time))
+        query = query.order_by(self.UrlNL.url)
+        if self.maximum_entries is not None:
+            query = query.limit(self.maximum_entries)
+
+        url_to_process = [url for (url,) in query.tuples().iterator()]
 
         n_url = len(url_to_process)
-        self.logger.debug(f"Found {n_url} kvk's to process with {number_in_range}"
-                          " in range")
+        self.logger.debug(f"Found {n_url} urls to process in range")
 
         # check the ranges
-        if number_in_range == 0:
-            raise ValueError(f"No urls numbers found in range {self.start_url} -- {self.stop_url}")
         if n_url == 0:
-            raise ValueError(f"Found {number_in_range} urls in rang {self.start_url} -- "
-                             f"{self.stop_url} but none to be processed")
+            raise ValueError(f"No urls found to process in range {self.start_url} -- "
+                             f"{self.stop_url}")
 
         if n_url < self.number_of_processes:
-            raise ValueError(f"Found {number_in_range} urls in range {self.start_url} -- "
-                             f"{self.stop_url} with {n_url} to process, with only "
+            raise ValueError(f"Found {n_url} urls in range {self.start_url} -- "
+                             f"{self.stop_url} to process, with only "
                              f"{self.number_of_processes} cores")
 
-        n_per_proc = int(n_url / self.number_of_processes) + n_url % self.number_of_processes
-        self.logger.debug("Number of urls's per process: {n_per_proc}")
         self.url_ranges = list()
+        for url_list in np.array_split(url_to_process, self.number_of_processes):
+            self.logger.debug(f"Number of urls's for process: {url_list.size}")
+            self.url_ranges.append(dict(start=str(url_list[0]), stop=str(url_list[-1])))
 
-        for i_proc in range(self.number_of_processes):
-            if i_proc == self.number_of_processes - 1:
-                url_list = url_to_process[i_proc * n_per_proc:]
-            else:
-                url_list = url_to_process[i_proc * n_per_proc:(i_proc + 1) * n_per_proc]
-
-            try:
-                logger.info("Getting range")
-                url_first = url_list[0]
-                url_last = url_list[-1]
-            except IndexError:
-                logger.warning("Something is wrong here")
-            else:
-                self.url_ranges.append(dict(start=url_first, stop=url_last))
+    def iterate_url_windows(self, query, window_size=URL_WINDOW_SIZE):
+        """
+        Iterate over the records of a UrlNL query, fetching *window_size* records at a time
+
+        Parameters
+        ----------
+        query: peewee.ModelSelect
+            Selection of the UrlNL table
+        window_size: int
+            Number of records which is fetched at once
+
+        Yields
+        ------
+        UrlNL:
+            The url records, in alphabetical order
+
+        Notes
+        -----
+        * Only the urls of the selection are kept in memory. The full records are fetched per
+          window, such that the memory use does not grow with the size of the selection
+        * The urls are selected at the start, so records added to the table while iterating are
+          not included, just like a normal iteration over the query
+        """
+        url_query = query.select(self.UrlNL.url).order_by(self.UrlNL.url).tuples()
+        urls = [url for (url,) in url_query.iterator()]
+        for i_start in range(0, len(urls), window_size):
+            window_urls = urls[i_start:i_start + window_size]
+            window_query = (self.UrlNL.select()
+                            .where(self.UrlNL.url.in_(window_urls))
+                            .order_by(self.UrlNL.url))
+            for q_url in window_query.iterator():
+                yield q_url
 
     def scrape_the_urls(self):
 
@@ -343,8 +353,13 @@ class UrlParser(mp.Process):
         self.logger.info("Counting all...")
         now = datetime.datetime.now(pytz.timezone(self.timezone))
         older = self.older_time
-        max_queries = [check_if_url_needs_update(q.datetime, now, older) or
-                       self.force_process for q in query].count(True)
+        # let the database count the urls which need an update (see check_if_url_needs_update)
+        # such that the query does not have to be fetched twice
+        count_query = query
+        if older and not self.force_process:
+            count_query = query.where(self.UrlNL.datetime.is_null() |
+                                      (self.UrlNL.datetime <= now - older))
+        max_queries = count_query.count()
         self.logger.info("Maximum queries obtained from selection as {}".format(max_queries))
 
         self.logger.info("Start processing {} queries between {} - {} ".format(max_queries,
@@ -357,13 +372,13 @@ class UrlParser(mp.Process):
             pbar = None
 
         start = time.time()
-        for cnt, q_url in enumerate(query):
+        for cnt, q_url in enumerate(self.iterate_url_windows(query)):
 
             # first check if we do not have to stop
             if self.maximum_entries is not None and cnt == self.maximum_entries:
                 self.logger.info("Maximum entries reached")
                 break
-            if os.path.exists(STOP_FILE):
+            if cnt % STOP_FILE_CHECK_INTERVAL == 0 and os.path.exists(STOP_FILE):
                 self.logger.info("Stop file found. Quit processing")
                 os.remove(STOP_FILE)
                 break
@@ -374,16 +389,16 @@ class UrlParser(mp.Process):
             url = q_url.url
 
             if self.filter_urls and url not in self.filter_urls:
-                logger.debug(f"filter urls is given so skip {url}")
+                logger.debug("filter urls is given so skip %s", url)
                 continue
 
             print_banner(f"Processing {url}")
 
             # quick check if we can processes this url based on the country code
-            url_extract = tldextract.extract(url)
+            url_extract = tld_extract(url)
             suffix = url_extract.suffix
-            if suffix in self.exclude_extensions.index:
-                logger.info(f"Web site {url} has suffix '.{suffix}' Skipping")
+            if suffix in self.exclude_extensions:
+                logger.info("Web site %s has suffix '.%s' Skipping", url, suffix)
                 continue
 
             q_url.datetime = now
@@ -392,11 +407,7 @@ class UrlParser(mp.Process):
             q_url.domain = url_extract.domain
 
             url_analyse = UrlSearchStrings(url,
-                                           search_strings={
-                                               POSTAL_CODE_KEY: ZIP_REGEXP,
-                                               KVK_KEY: KVK_REGEXP,
-                                               BTW_KEY: BTW_REGEXP
-                                           },
+                                           search_strings=SEARCH_STRINGS,
                                            sort_order_hrefs=SORT_ORDER_HREFS,
                                            stop_search_on_found_keys=[BTW_KEY],
                                            store_page_to_cache=self.store_html_to_cache,
@@ -409,12 +420,12 @@ class UrlParser(mp.Process):
             all_social_media = [sm.lower() for sm in SOCIAL_MEDIA]
             all_ecommerce = [ec.lower() for ec in PAY_OPTIONS]
             for external_url in url_analyse.external_hrefs:
-                dom = tldextract.extract(external_url).domain
+                dom = tld_extract(external_url).domain
                 if dom in all_social_media and dom not in sm_list:
-                    logger.debug(f"Found social media {dom}")
+                    logger.debug("Found social media %s", dom)
                     sm_list.append(dom)
                 if dom in all_ecommerce and dom not in ec_list:
-                    logger.debug(f"Found ecommerce {dom}")
+                    logger.debug("Found ecommerce %s", dom)
                     ec_list.append(dom)
             if ec_list:
                 q_url.ecommerce = paste_strings(ec_list, max_length=MAX_CHARFIELD_LENGTH)
@@ -430,10 +441,10 @@ class UrlParser(mp.Process):
             kvk_lijst = url_analyse.matches[KVK_KEY]
             btw_lijst = url_analyse.matches[BTW_KEY]
             postcode_set = set([standard_postcode(pc) for pc in postcode_lijst])
-            kvk_set = set([int(re.sub(r"\.", "", kvk)) for kvk in kvk_lijst])
-            btw_set = set([re.sub(r"\.", "", btw) for btw in btw_lijst])
+            kvk_list = list(dict.fromkeys(int(kvk.replace(".", "")) for kvk in kvk_lijst))
+            btw_set = {btw.replace(".", "") for btw in btw_lijst}
 
-            q_url.all_kvk = paste_strings(["{:08d}".format(kvk) for kvk in list(kvk_set)],
+            q_url.all_kvk = paste_strings(["{:08d}".format(kvk) for kvk in kvk_list],
                                           max_length=MAX_CHARFIELD_LENGTH)
             q_url.all_btw = paste_strings(list(btw_set), max_length=MAX_CHARFIELD_LENGTH)
             q_url.all_psc = paste_strings(list(postcode_set),
@@ -444,22 +455,27 @@ class UrlParser(mp.Process):
             except IndexError:
                 pass
 
-            if self.save:
-                q_url.save()
-
-            logger.debug(f"Check all external url ")
-            for external_url in url_analyse.external_hrefs:
-                if external_url is None:
-                    logger.debug("A None external href was stored. Check later why, skip for now")
-                    continue
-                logger.debug(f"Cleaning {external_url}")
-                clean_url = get_clean_url(external_url)
-                qq = self.UrlNL.select().where(self.UrlNL.url == clean_url)
-                if not qq.exists():
-                    logger.debug(f"Adding a new entry {clean_url}")
-                    self.UrlNL.create(url=clean_url, bestaat=True, referred_by=url)
-                else:
-                    logger.debug(f"url is already present {external_url}")
+            logger.debug("Check all external url ")
+            if None in url_analyse.external_hrefs:
+                logger.debug("A None external href was stored. Check later why, skip for now")
+            clean_urls = list(dict.fromkeys(get_clean_url(external_url)
+                                            for external_url in url_analyse.external_hrefs
+                                            if external_url is not None))
+
+            # store the url and its external urls in one transaction, such that there is only one
+            # commit per url instead of one per statement
+            with self.database.atomic():
+                if self.save:
+                    q_url.save()
+
+                # urls already present in the UrlNL table are skipped by the database
+                logger.debug("Adding %d new entries if not present", len(clean_urls))
+                chunk_size = get_sql_chunk_size(self.database, n_columns=3,
+                                                sql_batch_size=self.sql_batch_size)
+                for batch in pw.chunked(clean_urls, chunk_size):
+                    self.UrlNL.insert_many(
+                        [{URL_KEY: clean_url, BESTAAT_KEY: True, REFERRED_KEY: url}
+                         for clean_url in batch]).on_conflict_ignore().execute()
 
             self.logger.debug(url_analyse)
 
@@ -20,15 +20,13 @@ import datetime
 import collections
 import pytimeparse
 
-import pandas as pd
-import yaml
-
-from cbs_utils.misc import (create_logger, Chdir, make_directory, merge_loggers)
+from cbs_utils.misc import (create_logger, Chdir, merge_loggers)
 from cbs_utils import Q_
 from kvk_url_finder import LOGGER_BASE_NAME, CACHE_DIRECTORY
 from kvk_url_finder.url_engine import UrlParser
-from kvk_url_finder.models import DATABASE_TYPES
-from kvk_url_finder.utils import Range
+from kvk_url_finder.models import DATABASE_TYPES, SQL_BATCH_SIZE
+from kvk_url_finder.utils import (Range, load_settings_cached, ensure_directory,
+                                  set_progress_mode)
 
 try:
     from kvk_url_finder import __version__
@@ -123,6 +121,8 @@ def _parse_the_command_line_arguments(args):
                         help="Start processing at this url from the database")
     parser.add_argument("--stop_url", action="store",
                         help="Stop processing at this url from the database")
+    parser.add_argument("--sql_batch_size", type=check_positive, default=SQL_BATCH_SIZE,
+                        help="Number of records written to the sql tables with one statement")
 
     # parse the command line
     parsed_arguments = parser.parse_args(args)
@@ -143,7 +143,10 @@ def setup_logging(write_log_to_file=False,
     if write_log_to_file or progress_bar:
         # http://stackoverflow.com/questions/29087297/
         # is-there-a-way-to-change-the-filemode-for-a-logger-object-that-is-not-configured
-        # sys.stderr = open(log_file_base + ".err", 'w')
+        # in case stderr is redirected, open it line buffered such that the last lines are not
+        # lost on a crash:
+        # sys.stderr = open(log_file_base + ".err", "w", buffering=1, encoding="utf-8",
+        #                   errors="replace")
         pass
     else:
         log_file_base = None
@@ -158,17 +161,8 @@ def setup_logging(write_log_to_file=False,
                             console_log_format_long=True,
                             )
 
-    if progress_bar:
-        # switch off all logging because we are showing the progress bar via the print statement
-        # logger.disabled = True
-        # logger.disabled = True
-        # logger.setLevel(logging.CRITICAL)
-        for handle in _logger.handlers:
-            try:
-                getattr(handle, "baseFilename")
-            except AttributeError:
-                # this is the stream handle because we get an AtrributeError. Set it to critical
-                handle.setLevel(logging.CRITICAL)
+    # switch off the console logging if we are showing the progress bar via the print statement
+    set_progress_mode(_logger, progress_bar=progress_bar)
 
     # with this call we merge the settings of our logger with the logger in the cbs_utils logger
     # so we can control the output
@@ -189,8 +183,7 @@ def main(args_in):
 
     # with the global statement line we make sure to change the global variable at the top
     # when settings gup the logger
-    with open(args.configuration_file, "r") as stream:
-        settings = yaml.load(stream=stream, Loader=yaml.FullLoader)
+    settings = load_settings_cached(args.configuration_file)
 
     general = settings["general"]
     working_directory = general["working_directory"][platform.system()]
@@ -290,10 +283,8 @@ def main(args_in):
         if platform.system() == "Windows":
             script_name += ".exe"
 
-        start_time = pd.to_datetime("now")
-        message = "Start {script} (v: {version}) at {start_time}:\n{cmd}" \
-                  "".format(script=script_name, version=__version__,
-                            start_time=start_time, cmd=sys.argv[:])
+        start_time = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+        message = f"Start {script_name} (v: {__version__}) at {start_time}:\n{sys.argv[:]}"
         if not args.progressbar:
             logger.info(message)
         else:
@@ -304,8 +295,8 @@ def main(args_in):
             logger.setLevel(logging.INFO)
 
         # make the directories in case they do not exist yet
-        make_directory(CACHE_DIRECTORY)
-        make_directory(output_directory)
+        ensure_directory(CACHE_DIRECTORY)
+        ensure_directory(output_directory)
 
         url_range_process = dict(start=args.start_url, stop=args.stop_url)
 
@@ -383,7 +374,8 @@ def main(args_in):
                     user=user,
                     hostname=args.hostname,
                     older_time=older_time,
-                    filter_urls=filter_urls
+                    filter_urls=filter_urls,
+                    sql_batch_size=args.sql_batch_size
                 )
 
                 if args.n_processes > 1:
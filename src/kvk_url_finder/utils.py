@@ -1,19 +1,172 @@
+import collections
+import copy
 import datetime
+import functools
+import importlib.util
+import json
 import logging
+import os
 import re
+import tempfile
 import Levenshtein
 import tldextract
 import difflib
+import numpy as np
 import pandas as pd
+import yaml
 from pathlib import Path
 
 from cbs_utils.misc import (create_logger, merge_loggers, standard_postcode)
-from cbs_utils.web_scraping import UrlSearchStrings
-from kvk_url_finder import LOGGER_BASE_NAME
-from kvk_url_finder.models import (POSTAL_CODE_KEY, KVK_KEY, BTW_KEY, NAME_KEY)
+from cbs_utils.web_scraping import UrlSearchStrings, BTW_REGEXP, ZIP_REGEXP, KVK_REGEXP
+from kvk_url_finder import LOGGER_BASE_NAME, CACHE_DIRECTORY
+from kvk_url_finder.models import (POSTAL_CODE_KEY, KVK_KEY, BTW_KEY, DATABASE_TYPES)
+
+try:
+    # the libyaml based loader is much faster, but is not available for all installations
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# calamine reads excel files much faster than openpyxl. The engine is available from pandas 2.2
+# and only if the optional python-calamine package is installed
+_PANDAS_VERSION = tuple(int(v) for v in re.match(r"(\d+)\.(\d+)", pd.__version__).groups())
+if _PANDAS_VERSION >= (2, 2) and importlib.util.find_spec("python_calamine") is not None:
+    EXCEL_ENGINE = "calamine"
+else:
+    EXCEL_ENGINE = None
+
+try:
+    # rapidfuzz computes the string match in C++, much faster than difflib. Its bit-parallel
+    # Levenshtein distance is also faster than the one of python-Levenshtein
+    from rapidfuzz import process as rapidfuzz_process
+    from rapidfuzz.distance import Indel, Levenshtein as RapidLevenshtein
+except ImportError:
+    Indel = None
+    rapidfuzz_process = None
+    levenshtein_distance = Levenshtein.distance
+else:
+    levenshtein_distance = RapidLevenshtein.distance
 
 logger = logging.getLogger(LOGGER_BASE_NAME)
 
+# one extractor for all the urls. The public suffix list is taken from the snapshot included in
+# tldextract, such that it is never downloaded during a run
+TLD_EXTRACT = tldextract.TLDExtract(cache_dir=os.path.join(CACHE_DIRECTORY, "tld"),
+                                    suffix_list_urls=())
+
+# the maximum number of urls for which the split into subdomain/domain/suffix is remembered
+TLD_CACHE_SIZE = 131072
+
+# the maximum number of company names for which the name matches with their urls are remembered
+NAME_MATCH_CACHE_SIZE = 65536
+
+# the regular expressions searched for in each scraped web site. Defined once, such that all
+# UrlSearchStrings calls share the same mapping
+SEARCH_STRINGS = {
+    POSTAL_CODE_KEY: ZIP_REGEXP,
+    KVK_KEY: KVK_REGEXP,
+    BTW_KEY: BTW_REGEXP
+}
+
+# the extra url rank given to a web site based on its suffix and subdomain
+SUFFIX_SCORE = {"com": 0.1, "org": 0.1, "eu": 0.1, "nl": 0.2}
+SUBDOMAIN_SCORE = {"www": 0.1, "": 0.1}
+
+# the directories which have been created or checked already by this process
+_ENSURED_DIRECTORIES = set()
+
+# the layout of the yaml settings file. Optional fields get their default value from here
+_INPUT_DATABASE_SCHEMA = {
+    "type": "object",
+    "required": ["file_name", "keys"],
+    "properties": {
+        "file_name": {"type": "string"},
+        "keys": {"type": "object"},
+    },
+}
+_KVK_RANGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "start": {"type": ["integer", "null"], "default": None},
+        "stop": {"type": ["integer", "null"], "default": None},
+    },
+}
+_FILTERS_SCHEMA = {
+    "type": ["object", "null"],
+    "properties": {
+        "apply_filters": {"type": "boolean", "default": False},
+        "filters": {"type": ["array", "null"]},
+    },
+}
+SETTINGS_SCHEMA = {
+    "type": "object",
+    "required": ["general", "databases", "process_settings"],
+    "properties": {
+        "general": {
+            "type": "object",
+            "required": ["working_directory", "output_directory"],
+            "properties": {
+                "working_directory": {"type": "object"},
+                "output_directory": {"type": "string"},
+                "database_name": {"type": "string", "default": "kvk_db"},
+                "database_type": {"enum": list(DATABASE_TYPES), "default": "postgres"},
+                "store_html_to_cache": {"type": "boolean", "default": False},
+                "internet_scraping": {"type": "boolean", "default": True},
+                "force_ssl_check": {"type": "boolean", "default": False},
+                "search_urls": {"type": "boolean", "default": False},
+                "max_cache_dir_size": {"type": ["string", "number", "null"], "default": None},
+                "older_time": {"type": ["string", "null"], "default": None},
+                "certificate": {"type": ["string", "null"], "default": None},
+            },
+        },
+        "databases": {
+            "type": "object",
+            "required": ["addresses", "kvk_urls"],
+            "properties": {
+                "addresses": _INPUT_DATABASE_SCHEMA,
+                "kvk_urls": _INPUT_DATABASE_SCHEMA,
+            },
+        },
+        "kvk_selection": {
+            "type": ["object", "null"],
+            "properties": {
+                "apply_selection": {"type": "boolean", "default": False},
+                "type": {"enum": ["database", "kvk_list"], "default": "kvk_list"},
+                "database": {"type": "string"},
+                "kvk_list": {"type": ["array", "integer", "null"]},
+            },
+        },
+        "process_settings": {
+            "type": "object",
+            "required": ["n_url_count_threshold", "kvk_range_read", "kvk_range_process",
+                         "maximum_entries", "impose_url_for_kvk", "threshold_distance",
+                         "threshold_string_match"],
+            "properties": {
+                "n_url_count_threshold": {"type": "integer"},
+                "kvk_range_read": _KVK_RANGE_SCHEMA,
+                "kvk_range_process": _KVK_RANGE_SCHEMA,
+                "maximum_entries": {"type": ["integer", "null"]},
+                "impose_url_for_kvk": {"type": ["object", "null"]},
+                "threshold_distance": {"type": "number"},
+                "threshold_string_match": {"type": "number"},
+                "kvk_filters": _FILTERS_SCHEMA,
+                "url_filters": _FILTERS_SCHEMA,
+            },
+        },
+    },
+}
+
+if fastjsonschema is not None:
+    # generate the validation code only once
+    _settings_validator = fastjsonschema.compile(SETTINGS_SCHEMA)
+else:
+    _settings_validator = None
+
 
 class UrlCompanyRanking(object):
     """
@@ -23,7 +176,7 @@ class UrlCompanyRanking(object):
     def __init__(self, url, company_name, url_extract=None, url_analyse=None,
                  company_postcodes=None, company_kvk_nummer=None, company_btw_nummer=None,
                  threshold_string_match=None, threshold_distance=None, logger=None,
-                 max_url_score=3):
+                 max_url_score=3, distance=None, string_match=None):
 
         self.logger = logger
         self.company_name = company_name
@@ -41,15 +194,22 @@ class UrlCompanyRanking(object):
         self.max_url_score = max_url_score
 
         if url_extract is None:
-            self.ext = tldextract.extract(url)
+            self.ext = tld_extract(url)
         else:
             # we have passed the tld extract as an argument
             self.ext = url_extract
 
+        # the name and domain are compared case insensitive, so fold the case only once
+        self._company_name_lc = company_name.casefold()
+        self._sub_lc = self.ext.subdomain.casefold()
+        self._dom_lc = self.ext.domain.casefold()
+
         self.ranking = 0
 
-        self.distance: int = None
-        self.string_match: float = None
+        # the distance and string match may have been computed for all urls of the company at
+        # once with get_name_matches
+        self.distance: int = distance
+        self.string_match: float = string_match
         self.url_match: float = None
         self.url_rank: float = None
 
@@ -65,11 +225,13 @@ class UrlCompanyRanking(object):
         self.btw_nummer = None
 
         self.postcode_set = set()
-        self.kvk_set = set()
+        self.kvk_list = list()
         self.btw_set = set()
 
-        self.get_levenstein_distance()
-        self.get_string_match()
+        if self.distance is None:
+            self.get_levenstein_distance()
+        if self.string_match is None:
+            self.get_string_match()
 
         self.rank_contact_list()
         self.get_ranking()
@@ -82,8 +244,8 @@ class UrlCompanyRanking(object):
         # the subdomain may also contain the relevant part, e.g. for ramlehapotheek.leef.nl,
         # the sub domain is ramlehapotheek, which is closer to the company name the the
         # domain leef. Therefore pick the minimum
-        subdomain_dist = Levenshtein.distance(self.ext.subdomain, self.company_name)
-        domain_dist = Levenshtein.distance(self.ext.domain, self.company_name)
+        subdomain_dist = levenshtein_distance(self._sub_lc, self._company_name_lc)
+        domain_dist = levenshtein_distance(self._dom_lc, self._company_name_lc)
         self.distance = min(subdomain_dist, domain_dist)
 
     def get_string_match(self):
@@ -91,10 +253,17 @@ class UrlCompanyRanking(object):
         Get the string match. Th match is given by a float value between 0 (no match and 1 (fully
         matched)
         """
-        subdomain_match = difflib.SequenceMatcher(None, self.ext.subdomain,
-                                                  self.company_name).ratio()
-        domain_match = difflib.SequenceMatcher(None, self.ext.domain,
-                                               self.company_name).ratio()
+        if Indel is not None:
+            # the normalized Indel similarity is 2 * LCS / total length, a close approximation
+            # (LCS-based) of the ratio of SequenceMatcher. SequenceMatcher matches greedily on
+            # the longest blocks (Ratcliff/Obershelp), so it can score lower for the same pair
+            subdomain_match = Indel.normalized_similarity(self._sub_lc, self._company_name_lc)
+            domain_match = Indel.normalized_similarity(self._dom_lc, self._company_name_lc)
+        else:
+            subdomain_match = difflib.SequenceMatcher(None, self._sub_lc,
+                                                      self._company_name_lc).ratio()
+            domain_match = difflib.SequenceMatcher(None, self._dom_lc,
+                                                   self._company_name_lc).ratio()
         self.string_match = max(subdomain_match, domain_match)
 
     def rank_contact_list(self):
@@ -104,31 +273,18 @@ class UrlCompanyRanking(object):
 
         """
 
-        # create dataframe with the postcode, kvk and btw. for each occurrence of one of the items,
-        # add one
-        df = pd.DataFrame(index=[POSTAL_CODE_KEY, KVK_KEY, BTW_KEY])
+        # count per url how many of the items postcode, kvk and btw were found on it. Each item
+        # counts only once per url, no matter how many occurrences of the item the url has
+        contact_hits_per_url = collections.Counter()
         for key, url_p_m in self.url_analyse.url_per_match.items():
-            for match, url in url_p_m.items():
-                if url not in df.columns:
-                    df[url] = 0
-                df.loc[key, url] += 1
+            contact_hits_per_url.update(set(url_p_m.values()))
 
-        # clip the count per item to 0 or 1 (no or at least one occurrence)
-        contact_hits_per_url = df.astype(bool).sum()
-
-        # create a data frame for all urls per match in which we have the match and number of url
         for key, url_p_m in self.url_analyse.url_per_match.items():
-            match_list = list()
-            url_score = list()
-            for match, url in url_p_m.items():
-                match_list.append(match)
-                url_score.append(contact_hits_per_url[url])
-            match_df = pd.DataFrame(zip(match_list, url_score), columns=["match", "score"])
-            match_df.sort_values(["score"])
-
             # overwrite the match list of the current column postcode, kvk, btw such that the
-            # values with many other items is on top
-            match_list = list(match_df["match"].values)
+            # values with many other items is on top. The sort is stable, so equal scores keep
+            # their order
+            match_list = sorted(url_p_m, key=lambda match: contact_hits_per_url[url_p_m[match]],
+                                reverse=True)
             if len(match_list) == len(self.url_analyse.matches[key]):
                 self.url_analyse.matches[key] = match_list
 
@@ -149,28 +305,29 @@ class UrlCompanyRanking(object):
 
         # turn the lists into set such tht we only get the unique values
         self.postcode_set = set([standard_postcode(pc) for pc in postcode_lijst])
+        # houd de kvk nummers in de volgorde waarin ze op de site staan (zonder dubbelen)
         kvk_int_list = list()
         for kvk in kvk_lijst:
             try:
-                kvk_int = int(re.sub(r"\.", "", kvk))
+                kvk_int = int(kvk.replace(".", ""))
             except ValueError:
                 continue
             else:
                 kvk_int_list.append(kvk_int)
-        self.kvk_set = set(kvk_int_list)
-        self.btw_set = set([re.sub(r"\.", "", btw) for btw in btw_lijst])
+        self.kvk_list = list(dict.fromkeys(kvk_int_list))
+        self.btw_set = {btw.replace(".", "") for btw in btw_lijst}
 
         if self.company_postcodes:
             post_codes_on_side = self.company_postcodes.intersection(self.postcode_set)
             if post_codes_on_side:
                 self.has_postcode = True
-                self.matched_postcode = list(post_codes_on_side)[0]
+                self.matched_postcode = next(iter(post_codes_on_side))
                 self.ranking += 3
                 self.logger.debug(f"Found matching postcode. Added to ranking {self.ranking}")
         else:
             self.has_postcode = False
 
-        if self.company_kvk_nummer in self.kvk_set:
+        if self.company_kvk_nummer in self.kvk_list:
             self.has_kvk_nummer = True
             self.matched_kvk_nummer = self.company_kvk_nummer
             self.ranking += 3
@@ -179,7 +336,7 @@ class UrlCompanyRanking(object):
 
         if self.btw_set:
             self.has_btw_nummer = True
-            self.btw_nummer = re.sub(r"\.", "", list(self.btw_set)[0])
+            self.btw_nummer = next(iter(self.btw_set))
             self.ranking += 0  # for now we dont give a score to btw because we cannot validate it
             self.logger.debug(f"Found matching btw number {self.btw_nummer}. "
                               f"Added to ranking {self.ranking}")
@@ -191,15 +348,8 @@ class UrlCompanyRanking(object):
         rel_score = max((1 - self.url_match / self.threshold_distance), 0)
         self.url_rank = self.max_url_score * rel_score ** 2  # quick drop off for lower scores
 
-        if self.ext.suffix in ("com", "org", "eu"):
-            self.url_rank += 0.1
-        elif self.ext.suffix == "nl":
-            self.url_rank += 0.2
-
-        if self.ext.subdomain == "www":
-            self.url_rank += 0.1
-        elif self.ext.subdomain == "":
-            self.url_rank += 0.1
+        self.url_rank += (SUFFIX_SCORE.get(self.ext.suffix, 0) +
+                          SUBDOMAIN_SCORE.get(self.ext.subdomain, 0))
 
         # add the url matching score
         self.ranking += self.url_rank
@@ -220,7 +370,7 @@ class UrlInfo(object):
         self.index = index
         self.needs_update = False
         self.url = url
-        self.url_extract = tldextract.extract(url)
+        self.url_extract = tld_extract(url)
         self.outside_nl = False
         self.processing_time: datetime.datetime = None
         self.url_analyse: UrlSearchStrings = None
@@ -339,6 +489,282 @@ def check_if_url_needs_update(processing_time: datetime.datetime,
     return url_needs_update
 
 
+def ensure_directory(directory):
+    """
+    Create a directory including its parents if it does not exist yet
+
+    Parameters
+    ----------
+    directory: str or Path
+        Name of the directory
+
+    Notes
+    -----
+    * Each directory is only checked once per process. The absolute path is stored, such that a
+      relative directory is checked again after a change of the working directory
+    """
+    directory = os.path.abspath(directory)
+    if directory in _ENSURED_DIRECTORIES:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _ENSURED_DIRECTORIES.add(directory)
+
+
+def load_settings_cached(file_name, use_cache=True):
+    """
+    Read the yaml settings file. The parsed settings are stored in a json file next to the yaml
+    file (<file_name>.json), which is used on the next run as long as the yaml file has not been
+    modified
+
+    Parameters
+    ----------
+    file_name: str
+        Name of the yaml settings file
+    use_cache: bool
+        If False, the yaml file is always parsed and the cache file is neither read nor written
+
+    Returns
+    -------
+    dict:
+        The settings read from the yaml file
+
+    Notes
+    -----
+    * json is used and not pickle, such that reading the cache can never run code
+    * No directories are created. If the json file can not be written, the settings are just not
+      cached
+    * json can not store integer keys. The kvk numbers used as keys in *impose_url_for_kvk* are
+      converted back to integers when reading the cache. Settings which do not survive the round
+      trip through json (e.g. dates) are not cached at all
+    * The modification time and size of the yaml file are stored with the settings. The cache is
+      only used if both are still the same
+    * Within one process the settings are also kept in memory, such that repeated calls with the
+      same file do not have to read the cache file again
+    """
+    if not use_cache:
+        with open(file_name, "r") as stream:
+            return yaml.load(stream=stream, Loader=YamlLoader)
+
+    yaml_stat = os.stat(file_name)
+    yaml_key = (yaml_stat.st_mtime_ns, yaml_stat.st_size)
+
+    # the caller may modify the settings, so never hand out the instance we keep in memory
+    return copy.deepcopy(_read_settings(os.path.abspath(file_name), yaml_key))
+
+
+def _settings_from_json(settings):
+    """ Convert the kvk keys of impose_url_for_kvk of settings read from json back to int """
+    try:
+        imposed_urls = settings["process_settings"]["impose_url_for_kvk"]
+    except (KeyError, TypeError):
+        return settings
+    if isinstance(imposed_urls, dict):
+        settings["process_settings"]["impose_url_for_kvk"] = {
+            int(kvk) if kvk.isdigit() else kvk: url for kvk, url in imposed_urls.items()}
+    return settings
+
+
+@functools.lru_cache(maxsize=TLD_CACHE_SIZE)
+def tld_extract(url):
+    """
+    Split the url into subdomain, domain and suffix
+
+    Parameters
+    ----------
+    url: str
+        The url to split
+
+    Returns
+    -------
+    ExtractResult:
+        The result of TLD_EXTRACT. As the same urls (facebook.com, linkedin.com, ...) occur for
+        many companies, the results are cached
+    """
+    return TLD_EXTRACT(url)
+
+
+def get_name_matches(company_name, url_extracts):
+    """
+    Get the Levenshtein distance and string match of the company name for a list of urls
+
+    Parameters
+    ----------
+    company_name: str
+        The cleaned company name
+    url_extracts: list
+        The tld extract results of the urls
+
+    Returns
+    -------
+    tuple (tuple, tuple):
+        The distances and string matches per url, defined as in
+        UrlCompanyRanking.get_levenstein_distance and get_string_match: the best of the
+        subdomain and the domain
+
+    Notes
+    -----
+    * With rapidfuzz, the subdomains and domains of all urls are compared to the company name
+      with one cdist call per score, instead of two scalar calls per url and score
+    * The results are cached on the company name and the (subdomain, domain) pairs, as
+      companies with the same name (e.g. the branches of a chain) share the same urls
+    * The string match of rapidfuzz (normalized Indel similarity, LCS-based) is a close
+      approximation of the ratio of difflib.SequenceMatcher, which is used if rapidfuzz is not
+      installed. The ratio can be lower, so scores close to the threshold_string_match may
+      differ between the two
+    """
+    # compare case insensitive, like UrlCompanyRanking
+    domains = tuple((ext.subdomain.casefold(), ext.domain.casefold()) for ext in url_extracts)
+    return _get_name_matches(company_name.casefold(), domains)
+
+
+@functools.lru_cache(maxsize=NAME_MATCH_CACHE_SIZE)
+def _get_name_matches(company_name, domains):
+    """ Compute the result of get_name_matches for a tuple of (subdomain, domain) pairs """
+    n_urls = len(domains)
+    choices = [subdomain for subdomain, _ in domains] + [domain for _, domain in domains]
+    if rapidfuzz_process is not None and n_urls > 0:
+        distances = rapidfuzz_process.cdist([company_name], choices,
+                                            scorer=RapidLevenshtein.distance)[0]
+        ratios = rapidfuzz_process.cdist([company_name], choices,
+                                         scorer=Indel.normalized_similarity,
+                                         dtype=np.float64)[0]
+        distances = tuple(int(dist) for dist in
+                          np.minimum(distances[:n_urls], distances[n_urls:]))
+        string_matches = tuple(float(ratio) for ratio in
+                               np.maximum(ratios[:n_urls], ratios[n_urls:]))
+    else:
+        distances = tuple(min(levenshtein_distance(subdomain, company_name),
+                              levenshtein_distance(domain, company_name))
+                          for subdomain, domain in domains)
+        string_matches = tuple(
+            max(difflib.SequenceMatcher(None, subdomain, company_name).ratio(),
+                difflib.SequenceMatcher(None, domain, company_name).ratio())
+            for subdomain, domain in domains)
+    return distances, string_matches
+
+
+@functools.lru_cache(maxsize=8)
+def _read_settings(file_name, yaml_key):
+    """
+    Read the settings from the json cache file if it belongs to the current yaml file, otherwise
+    parse the yaml file and update the cache file
+    """
+    cache_file = file_name + ".json"
+
+    try:
+        with open(cache_file, "r") as stream:
+            cache_key, settings = json.load(stream)
+    except (OSError, ValueError, TypeError):
+        logger.debug(f"No valid settings cache file {cache_file}")
+    else:
+        if tuple(cache_key) == yaml_key:
+            logger.debug(f"Read settings from cache file {cache_file}")
+            return _settings_from_json(settings)
+
+    with open(file_name, "r") as stream:
+        settings = yaml.load(stream=stream, Loader=YamlLoader)
+
+    try:
+        cache_text = json.dumps([list(yaml_key), settings])
+    except (TypeError, ValueError) as err:
+        logger.debug(f"Settings can not be stored as json: {err}")
+        return settings
+    if _settings_from_json(json.loads(cache_text)[1]) != settings:
+        logger.debug("Settings do not survive the conversion to json. Do not cache them")
+        return settings
+
+    # write to a temporary file first and then move it, such that we never leave a half written
+    # cache file behind
+    try:
+        with tempfile.NamedTemporaryFile(mode="w", dir=os.path.dirname(cache_file),
+                                         delete=False) as stream:
+            stream.write(cache_text)
+        os.replace(stream.name, cache_file)
+    except OSError as err:
+        logger.debug(f"Could not write settings cache file {cache_file}: {err}")
+    else:
+        logger.debug(f"Wrote settings cache file {cache_file}")
+
+    return settings
+
+
+def settings_validation_available():
+    """ True if the settings can be checked against the SETTINGS_SCHEMA by validate_settings """
+    return _settings_validator is not None
+
+
+def validate_settings(settings):
+    """
+    Check the settings against the SETTINGS_SCHEMA and fill in the default values of the optional
+    fields which are missing
+
+    Parameters
+    ----------
+    settings: dict
+        The settings as read from the yaml file
+
+    Returns
+    -------
+    dict:
+        The validated settings
+
+    Raises
+    ------
+    ValueError:
+        In case the settings do not match the schema
+
+    Notes
+    -----
+    * The validation is only done if fastjsonschema is installed (see requirements.txt). If not,
+      a warning is given and the settings are returned as they are
+    """
+    if _settings_validator is None:
+        logger.warning("fastjsonschema is not installed. Skipping validation of the settings")
+        return settings
+
+    return _settings_validator(settings)
+
+
+# if true, the console handlers only show critical messages such that the progress bar is readable
+PROGRESS_MODE = False
+
+
+class _ProgressFilter(logging.Filter):
+    """ Filter for the console handlers which blocks all but the critical messages in progress mode
+    """
+
+    def filter(self, record):
+        return not PROGRESS_MODE or record.levelno >= logging.CRITICAL
+
+
+_PROGRESS_FILTER = _ProgressFilter()
+
+
+def set_progress_mode(_logger, progress_bar=False):
+    """
+    Switch off the console logging of a logger if we are showing the progress bar via the print
+    statement
+
+    Parameters
+    ----------
+    _logger: Logger
+        The logger of which the console handlers get the progress filter
+    progress_bar: bool
+        If true, only the critical messages are shown on the console. The file handlers are not
+        affected
+
+    Notes
+    -----
+    * The filter is attached only once to each stream handler; after that the flag decides, such
+      that the level of the handlers is never changed
+    """
+    global PROGRESS_MODE
+    PROGRESS_MODE = progress_bar
+    for handle in _logger.handlers:
+        if not isinstance(handle, logging.FileHandler) and _PROGRESS_FILTER not in handle.filters:
+            handle.addFilter(_PROGRESS_FILTER)
+
+
 def setup_logging(logger_name=None,
                   write_log_to_file=False,
                   log_file_base="log",
@@ -353,7 +779,10 @@ def setup_logging(logger_name=None,
     if write_log_to_file or progress_bar:
         # http://stackoverflow.com/questions/29087297/
         # is-there-a-way-to-change-the-filemode-for-a-logger-object-that-is-not-configured
-        # sys.stderr = open(log_file_base + ".err", 'w')
+        # in case stderr is redirected, open it line buffered such that the last lines are not
+        # lost on a crash:
+        # sys.stderr = open(log_file_base + ".err", "w", buffering=1, encoding="utf-8",
+        #                   errors="replace")
         pass
     else:
         log_file_base = None
@@ -373,17 +802,8 @@ def setup_logging(logger_name=None,
                             console_log_format_long=True,
                             )
 
-    if progress_bar:
-        # switch off all logging because we are showing the progress bar via the print statement
-        # logger.disabled = True
-        # logger.disabled = True
-        # logger.setLevel(logging.CRITICAL)
-        for handle in _logger.handlers:
-            try:
-                getattr(handle, "baseFilename")
-            except AttributeError:
-                # this is the stream handle because we get an AtrributeError. Set it to critical
-                handle.setLevel(logging.CRITICAL)
+    # switch off the console logging if we are showing the progress bar via the print statement
+    set_progress_mode(_logger, progress_bar=progress_bar)
 
     # with this call we merge the settings of our logger with the logger in the cbs_utils logger
     # so we can control the output
@@ -529,7 +949,7 @@ def merge_external_database(CompanyTbl, kvk_selection_input_file_name,
     df_sql = pd.DataFrame(list(query.dicts()))
     df_sql.set_index(KVK_KEY, inplace=True)
 
-    df = pd.read_excel(kvk_selection_input_file_name)
+    df = pd.read_excel(kvk_selection_input_file_name, engine=EXCEL_ENGINE)
 
     df.rename(columns={kvk_selection_kvk_key: KVK_KEY}, inplace=True)
 
@@ -566,7 +986,9 @@ def read_database_selection(kvk_selection_input_file_name, kvk_selection_kvk_key
 
     """
     logger.info(f"Reading selection data base from {kvk_selection_input_file_name}")
-    df = pd.read_excel(kvk_selection_input_file_name)
+    # only the kvk column is needed
+    df = pd.read_excel(kvk_selection_input_file_name, engine=EXCEL_ENGINE,
+                       usecols=[kvk_selection_kvk_key])
 
     logger.debug(f"Dropping duplicates")
     df.drop_duplicates([kvk_selection_kvk_key], inplace=True)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import types
+
+import pytest
+
+pw = pytest.importorskip("peewee")
+kvk_engine = pytest.importorskip("kvk_url_finder.kvk_engine")
+models = pytest.importorskip("kvk_url_finder.models")
+
+__author__ = "Eelco van Vliet"
+__copyright__ = "Eelco van Vliet"
+__license__ = "mit"
+
+
+class Site(pw.Model):
+    kvk_nummer = pw.IntegerField(primary_key=True)
+    url = pw.CharField(null=True)
+    ranking = pw.FloatField(null=True)
+
+
+@pytest.fixture
+def parser():
+    database = pw.SqliteDatabase(":memory:")
+    database.bind([Site])
+    database.connect()
+    database.create_tables([Site])
+    # insert_rows only needs the database of the parser
+    yield types.SimpleNamespace(database=database)
+    database.close()
+
+
+def insert_rows(parser, rows, ignore_conflicts=False):
+    fields = [Site.kvk_nummer, Site.url, Site.ranking]
+    kvk_engine.KvKUrlParser.insert_rows(parser, Site, fields, rows,
+                                        ignore_conflicts=ignore_conflicts)
+
+
+def stored_rows():
+    return list(Site.select().order_by(Site.kvk_nummer).tuples())
+
+
+def test_insert_rows(parser):
+    insert_rows(parser, [(1, "www.een.nl", 1.5), (2, "www.twee.nl", float("nan"))])
+    # NaN is stored as NULL
+    assert stored_rows() == [(1, "www.een.nl", 1.5), (2, "www.twee.nl", None)]
+
+
+def test_insert_no_rows(parser):
+    insert_rows(parser, [])
+    assert stored_rows() == []
+
+
+def test_insert_rows_ignore_conflicts(parser):
+    insert_rows(parser, [(1, "www.een.nl", 1.0)])
+    with pytest.raises(pw.IntegrityError):
+        insert_rows(parser, [(1, "www.ander.nl", 2.0)])
+    insert_rows(parser, [(1, "www.ander.nl", 2.0), (3, "www.drie.nl", 3.0)],
+                ignore_conflicts=True)
+    assert stored_rows() == [(1, "www.een.nl", 1.0), (3, "www.drie.nl", 3.0)]
+
+
+def test_insert_rows_of_one_chunk(parser):
+    # one chunk of the maximum size must fit in a single statement
+    chunk_size = models.get_sql_chunk_size(parser.database, n_columns=3,
+                                           sql_batch_size=100000)
+    assert chunk_size * 3 <= models.SQLITE_MAX_VARIABLES
+    insert_rows(parser, [(kvk, "www.{}.nl".format(kvk), None) for kvk in range(chunk_size)])
+    assert Site.select().count() == chunk_size
+
+
+def test_sql_chunk_size():
+    database = pw.SqliteDatabase(":memory:")
+    assert models.get_sql_chunk_size(database, n_columns=3, sql_batch_size=10) == 10
+    assert models.get_sql_chunk_size(database, n_columns=10 ** 6) == 1
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import difflib
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+utils = pytest.importorskip("kvk_url_finder.utils")
+
+__author__ = "Eelco van Vliet"
+__copyright__ = "Eelco van Vliet"
+__license__ = "mit"
+
+UrlExtract = collections.namedtuple("UrlExtract", ["subdomain", "domain", "suffix"])
+
+
+def test_name_matches():
+    # the distance and string match are the best of the subdomain and the domain
+    extracts = [UrlExtract("www", "bakkerij-jansen", "nl"),
+                UrlExtract("deboer", "leef", "nl"),
+                UrlExtract("", "autokapsalon", "nl")]
+    distances, string_matches = utils.get_name_matches("bakkerijjansen", extracts)
+    assert distances == (1, 12, 11)
+    assert string_matches == pytest.approx((0.965517, 0.3, 0.384615), abs=1e-6)
+
+
+def test_name_matches_is_case_insensitive():
+    distances, string_matches = utils.get_name_matches("DeBoer", [UrlExtract("", "deboer", "nl")])
+    assert distances == (0,)
+    assert string_matches == (1.0,)
+
+
+def test_string_match_approximates_sequence_matcher():
+    # the LCS based Indel similarity equals the ratio of SequenceMatcher for most names, but can
+    # be higher, as SequenceMatcher matches greedily on the longest blocks
+    name = "autogaragebakker"
+    _, (same,) = utils.get_name_matches(name, [UrlExtract("", "garagebakker", "nl")])
+    assert same == pytest.approx(difflib.SequenceMatcher(None, "garagebakker", name).ratio())
+
+    _, (higher,) = utils.get_name_matches(name, [UrlExtract("", "autokapsalon", "nl")])
+    assert higher == pytest.approx(0.428571, abs=1e-6)
+    assert difflib.SequenceMatcher(None, "autokapsalon", name).ratio() == pytest.approx(
+        0.357143, abs=1e-6)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+utils = pytest.importorskip("kvk_url_finder.utils")
+
+__author__ = "Eelco van Vliet"
+__copyright__ = "Eelco van Vliet"
+__license__ = "mit"
+
+SETTINGS = """
+general:
+  working_directory: .
+process_settings:
+  impose_url_for_kvk:
+    12345678: www.bakkerijjansen.nl
+    87654321: www.deboer.nl
+"""
+
+
+@pytest.fixture
+def settings_file(tmp_path):
+    file_name = tmp_path / "kvk_url_finder.yml"
+    file_name.write_text(SETTINGS)
+    return str(file_name)
+
+
+def test_settings_cache_round_trip(settings_file, tmp_path, monkeypatch):
+    # the cache file must be written next to the yaml file, not in the working directory
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+
+    settings = utils.load_settings_cached(settings_file)
+    cache_file = settings_file + ".json"
+    assert os.path.exists(cache_file)
+    assert os.listdir(str(work_dir)) == []
+
+    # read the json cache instead of the in memory settings
+    utils._read_settings.cache_clear()
+    cached = utils.load_settings_cached(settings_file)
+    assert cached == settings
+    imposed_urls = cached["process_settings"]["impose_url_for_kvk"]
+    assert imposed_urls == {12345678: "www.bakkerijjansen.nl", 87654321: "www.deboer.nl"}
+
+
+def test_settings_cache_is_refreshed(settings_file):
+    utils.load_settings_cached(settings_file)
+    with open(settings_file, "a") as stream:
+        stream.write("    11111111: www.nieuw.nl\n")
+    settings = utils.load_settings_cached(settings_file)
+    assert settings["process_settings"]["impose_url_for_kvk"][11111111] == "www.nieuw.nl"
+    with open(settings_file + ".json", "r") as stream:
+        _, cached = json.load(stream)
+    assert "11111111" in cached["process_settings"]["impose_url_for_kvk"]
+
+
+def test_settings_without_cache(settings_file):
+    settings = utils.load_settings_cached(settings_file, use_cache=False)
+    assert 12345678 in settings["process_settings"]["impose_url_for_kvk"]
+    assert not os.path.exists(settings_file + ".json")
+
+
+def test_settings_are_copied(settings_file):
+    settings = utils.load_settings_cached(settings_file)
+    settings["general"]["working_directory"] = "elders"
+    assert utils.load_settings_cached(settings_file)["general"]["working_directory"] == "."